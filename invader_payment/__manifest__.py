@@ -12,5 +12,6 @@
     "application": False,
     "installable": True,
     "external_dependencies": {"python": ["cerberus", "unidecode"], "bin": []},
-    "depends": ["payment", "component", "component_event"],
+    "depends": ["payment", "base_rest", "component", "component_event"],
+    "data": ["security/security.xml", "data/ir_cron.xml"],
 }
@@ -0,0 +1,2 @@
+from . import cerberus_validator
+from . import event_listener
@@ -0,0 +1,66 @@
+# Copyright 2019 ACSONE SA/NV
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import functools
+import threading
+
+from cerberus import Validator
+
+from odoo.addons.component.core import Component
+
+
+class BaseRestCerberusValidator(Component):
+    """Cache the compiled validators declared static by the services
+
+    A service declares the validator methods returning a schema that only
+    depends on the components (not on the request, the user or the
+    collection record) in ``_invader_static_validators``::
+
+        _invader_static_validators = (
+            "_validator_confirm_payment",
+            "_validator_return_confirm_payment",
+        )
+
+    The compiled ``cerberus.Validator`` is then built once per service
+    component class. The cache lives on the component class, which is
+    rebuilt when the Odoo's registry is reloaded, and is local to the
+    thread as a validator keeps the state of the last validation.
+    """
+
+    _inherit = "base.rest.cerberus.validator"
+
+    @classmethod
+    def _complete_component_build(cls):
+        super()._complete_component_build()
+        cls._invader_validators_cache = threading.local()
+
+    def get_validator_handler(self, service, method_name, direction):
+        handler = super().get_validator_handler(
+            service, method_name, direction
+        )
+        static_validators = getattr(service, "_invader_static_validators", ())
+        if method_name not in static_validators:
+            return handler
+        return functools.partial(
+            self._invader_get_static_validator,
+            type(service),
+            method_name,
+            handler,
+        )
+
+    def _invader_get_static_validator(
+        self, service_class, method_name, handler
+    ):
+        cache = getattr(self._invader_validators_cache, "validators", None)
+        if cache is None:
+            cache = self._invader_validators_cache.validators = {}
+        key = (service_class, method_name)
+        validator = cache.get(key)
+        if validator is None:
+            schema = handler()
+            if isinstance(schema, Validator):
+                validator = schema
+            else:
+                # same as base_rest.restapi.CerberusValidator
+                validator = Validator(schema, purge_unknown=True)
+            cache[key] = validator
+        return validator
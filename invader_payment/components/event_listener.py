@@ -0,0 +1,36 @@
+# Copyright 2019 ACSONE SA/NV
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+from odoo.addons.component.core import AbstractComponent
+
+EVENT_MODE_SYNC = "sync"
+EVENT_MODE_POST_COMMIT = "post_commit"
+EVENT_MODE_JOB = "job"
+
+
+class EventListener(AbstractComponent):
+    _inherit = "base.event.listener"
+
+    # Execution mode of the ``on_payment_transaction_*`` events of the
+    # listener, by event name:
+    # * "sync" (default): run inside the transaction writing the state
+    # * "post_commit": run after the commit of the transaction, in a new
+    #   cursor
+    # * "job": run from a queue job (falls back to "post_commit" when
+    #   queue_job is not installed)
+    # e.g. {"on_payment_transaction_done": "post_commit"}
+    _invader_deferred_events = {}
+
+    def _invader_get_event_mode(self, event_name):
+        """
+        Return how the given payment transaction event must be executed
+        for this listener. Override to decide dynamically.
+        """
+        return self._invader_deferred_events.get(event_name, EVENT_MODE_SYNC)
+
+    def _invader_on_deferred_event(self, event_name, payables, transactions):
+        """
+        Called inside the transaction writing the state when the event
+        ``event_name`` is deferred, to do what cannot wait for the deferred
+        run (e.g. update the customer session of the current request).
+        """
+        return
@@ -0,0 +1,16 @@
+# Copyright 2019 ACSONE SA/NV
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+
+class NotReplayableResponse(Exception):
+    """
+    Raised by the function of an idempotent call (see
+    ``InvaderPaymentService._invader_idempotent_call``) to answer with a
+    response that must not be stored for the replays, e.g. a failure not
+    due to the request itself. The idempotency key is released, so a retry
+    of the request is processed again.
+    """
+
+    def __init__(self, response):
+        super().__init__(response)
+        self.response = response
@@ -0,0 +1,162 @@
+# Copyright 2019 ACSONE SA/NV
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Timing spans and counters of the invader payment services
+
+Usage::
+
+    from odoo.addons.invader_payment import metrics
+
+    with metrics.span("payment_stripe.provider_call", self.env.cr):
+        ...
+    metrics.increment("payment_stripe.provider_error")
+
+Spans record their duration and, when a cursor is given, the number of SQL
+queries run inside them. Spans and counters are sent to the registered
+sinks: by default they are logged (debug level of this module logger) and
+aggregated in-process in ``metrics.registry``, which can be queried from
+tests::
+
+    metrics.registry.get_span("payment_stripe.provider_call")["count"]
+
+Other backends (statsd, prometheus...) can be plugged with
+``register_sink``.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+_logger = logging.getLogger(__name__)
+
+
+class MetricsSink(object):
+    """Base class of the metrics sinks"""
+
+    def record_span(self, name, duration, queries, tags):
+        """
+        :param name: name of the span
+        :param duration: duration in seconds
+        :param queries: number of SQL queries, None when unknown
+        :param tags: dict of additional information
+        """
+
+    def increment(self, name, value, tags):
+        """
+        :param name: name of the counter
+        :param value: increment
+        :param tags: dict of additional information
+        """
+
+
+class LoggingSink(MetricsSink):
+    def __init__(self, logger=_logger, level=logging.DEBUG):
+        self.logger = logger
+        self.level = level
+
+    def record_span(self, name, duration, queries, tags):
+        self.logger.log(
+            self.level,
+            "span %s: %.2fms, %s queries %s",
+            name,
+            duration * 1000,
+            queries,
+            tags,
+        )
+
+    def increment(self, name, value, tags):
+        self.logger.log(self.level, "counter %s: +%s %s", name, value, tags)
+
+
+class RegistrySink(MetricsSink):
+    """Aggregate the spans and counters by name, in the current process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._spans = {}
+            self._counters = {}
+
+    def record_span(self, name, duration, queries, tags):
+        with self._lock:
+            stats = self._spans.setdefault(
+                name,
+                {
+                    "count": 0,
+                    "duration": 0.0,
+                    "max_duration": 0.0,
+                    "queries": 0,
+                },
+            )
+            stats["count"] += 1
+            stats["duration"] += duration
+            stats["max_duration"] = max(stats["max_duration"], duration)
+            stats["queries"] += queries or 0
+
+    def increment(self, name, value, tags):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get_span(self, name):
+        """Return the aggregated stats of a span, None if never recorded"""
+        with self._lock:
+            stats = self._spans.get(name)
+            return dict(stats) if stats else None
+
+    def get_counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "spans": {name: dict(s) for name, s in self._spans.items()},
+                "counters": dict(self._counters),
+            }
+
+
+registry = RegistrySink()
+_sinks = [LoggingSink(), registry]
+
+
+def register_sink(sink):
+    _sinks.append(sink)
+
+
+def unregister_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def _dispatch(method_name, *args):
+    for sink in list(_sinks):
+        try:
+            getattr(sink, method_name)(*args)
+        except Exception:
+            # metrics must never break a payment
+            _logger.exception("Error in metrics sink %s", sink)
+
+
+@contextmanager
+def span(name, cr=None, **tags):
+    """Measure the duration and the SQL queries of the enclosed block
+
+    :param name: name of the span
+    :param cr: optional database cursor to count the SQL queries
+    """
+    start_queries = cr.sql_log_count if cr is not None else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        queries = None
+        if cr is not None:
+            queries = cr.sql_log_count - start_queries
+        _dispatch("record_span", name, duration, queries, tags)
+
+
+def increment(name, value=1, **tags):
+    _dispatch("increment", name, value, tags)
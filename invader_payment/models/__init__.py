@@ -1,2 +1,4 @@
 from . import invader_payable
+from . import invader_payment_idempotency_key
+from . import payment_acquirer
 from . import payment_transaction
@@ -0,0 +1,115 @@
+# Copyright 2019 ACSONE SA/NV
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+import psycopg2
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+
+from ..exceptions import NotReplayableResponse
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_HOURS = 24
+
+
+class InvaderPaymentIdempotencyKey(models.Model):
+
+    _name = "invader.payment.idempotency.key"
+    _description = "Idempotency keys of the invader payment services"
+    _log_access = False
+    _order = "date desc"
+
+    key = fields.Char(required=True, readonly=True)
+    scope = fields.Char(
+        required=True,
+        readonly=True,
+        help="Service method and payable the key applies to",
+    )
+    fingerprint = fields.Char(
+        required=True, readonly=True, help="Hash of the request parameters"
+    )
+    response = fields.Text(readonly=True)
+    date = fields.Datetime(
+        required=True, readonly=True, index=True, default=fields.Datetime.now
+    )
+
+    _sql_constraints = [
+        (
+            "key_scope_uniq",
+            "unique(key, scope)",
+            "The idempotency key must be unique per scope",
+        )
+    ]
+
+    @api.model
+    def _get_fingerprint(self, params):
+        data = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    @api.model
+    def _call(self, key, scope, params, func):
+        """
+        Call ``func`` once for the given key and scope and store its
+        response. A replayed call returns the stored response without
+        calling ``func``.
+
+        :param key: idempotency key given by the client
+        :param scope: string identifying the service method and the payable
+        :param params: request parameters, a replay must give the same ones
+        :param func: callable without argument returning a json-serializable
+                     response, or raising NotReplayableResponse
+        """
+        fingerprint = self._get_fingerprint(params)
+        record = self.search([("key", "=", key), ("scope", "=", scope)])
+        if not record:
+            try:
+                with self.env.cr.savepoint():
+                    record = self.create(
+                        {
+                            "key": key,
+                            "scope": scope,
+                            "fingerprint": fingerprint,
+                        }
+                    )
+            except psycopg2.IntegrityError:
+                # a concurrent request with the same key has been committed
+                raise UserError(
+                    _("A request with the same idempotency key is in progress")
+                )
+            try:
+                response = func()
+            except NotReplayableResponse as e:
+                record.unlink()
+                return e.response
+            record.response = json.dumps(response)
+            return response
+        if record.fingerprint != fingerprint:
+            raise UserError(
+                _("The idempotency key has been used with other parameters")
+            )
+        if record.response is False:
+            # committed before the end of the call by a service committing
+            # the cursor of the request
+            raise UserError(
+                _("A request with the same idempotency key is in progress")
+            )
+        _logger.info("Replay of request with idempotency key %s", key)
+        return json.loads(record.response)
+
+    @api.model
+    def _gc_expired_keys(self):
+        """Remove the keys older than the TTL (in hours)"""
+        ttl = int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param(
+                "invader_payment.idempotency_key_ttl", DEFAULT_TTL_HOURS
+            )
+        )
+        limit = fields.Datetime.now() - timedelta(hours=ttl)
+        self.search([("date", "<", limit)]).unlink()
@@ -0,0 +1,79 @@
+# Copyright 2019 ACSONE SA/NV
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+from odoo import api, models, tools
+from odoo.tools import frozendict
+
+
+class PaymentAcquirer(models.Model):
+
+    _inherit = "payment.acquirer"
+
+    def _invader_get_config_values(self):
+        """
+        Return the provider configuration of the acquirer used by the
+        invader payment services. Provider modules extend it with their own
+        values (keys, urls...).
+
+        ``capture_later``: the authorized transactions are captured later
+        (e.g. when the order ships), so the payable can be processed once
+        the transaction is authorized.
+
+        :return: dict
+        """
+        self.ensure_one()
+        return {
+            "id": self.id,
+            "provider": self.provider,
+            "state": self.state,
+            "company_id": self.company_id.id,
+            "capture_later": False,
+        }
+
+    @api.model
+    @tools.ormcache("acquirer_id")
+    def _invader_get_config_snapshot(self, acquirer_id):
+        acquirer = self.sudo().browse(acquirer_id)
+        return frozendict(acquirer._invader_get_config_values())
+
+    def _invader_get_config(self):
+        """
+        Return an immutable snapshot of the acquirer configuration (see
+        ``_invader_get_config_values``), cached per worker until the next
+        write on a ``payment.acquirer``.
+
+        :return: frozendict
+        """
+        self.ensure_one()
+        return self._invader_get_config_snapshot(self.id)
+
+    @api.model
+    @tools.ormcache("provider")
+    def _invader_get_provider_acquirer_ids(self, provider):
+        """
+        Return the ids of the acquirers of a provider (archived included),
+        cached per worker until the next change of a ``payment.acquirer``.
+
+        :return: tuple
+        """
+        acquirers = (
+            self.sudo()
+            .with_context(active_test=False)
+            .search([("provider", "=", provider)])
+        )
+        return tuple(acquirers.ids)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.clear_caches()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.clear_caches()
+        return res
@@ -1,6 +1,18 @@
 # Copyright 2019 ACSONE SA/NV
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
-from odoo import api, models
+import logging
+from collections import OrderedDict
+
+from odoo import api, models, registry
+
+from .. import metrics
+from ..components.event_listener import (
+    EVENT_MODE_JOB,
+    EVENT_MODE_POST_COMMIT,
+    EVENT_MODE_SYNC,
+)
+
+_logger = logging.getLogger(__name__)
 
 
 class PaymentTransaction(models.Model):
@@ -29,10 +41,49 @@ class PaymentTransaction(models.Model):
                 pass
             ...
 
+        When the transactions are notified in batch (see
+        ``_notify_state_changed_event_batch``), a listener can declare a
+        recordset-level handler instead:
+
+            def on_payment_transaction_batch_draft(
+                self, invader_payables, transactions):
+                pass
+
+        Heavy listeners can be run after the commit of the transaction or
+        from a queue job by declaring the events to defer on the listener
+        (see ``base.event.listener`` in ``components/event_listener.py``):
+
+            _invader_deferred_events = {
+                "on_payment_transaction_done": "post_commit",
+            }
+
         """
         self.ensure_one()
         return None
 
+    def _get_invader_payables_map(self):
+        """
+        Recordset-level counterpart of ``_get_invader_payables``
+
+        Returns a dictionary {transaction: invader_payables} for all the
+        transactions of the recordset. Overrides should resolve the
+        transactions they know about in one read of the relation (to benefit
+        from the ORM prefetch) and let ``super()`` resolve the remaining ones,
+        e.g.:
+
+            def _get_invader_payables_map(self):
+                resolved = self.filtered("my_payable_ids")
+                res = super(
+                    PaymentTransaction, self - resolved
+                )._get_invader_payables_map()
+                res.update({tx: tx.my_payable_ids for tx in resolved})
+                return res
+
+        By default, the remaining transactions fall back to the per-record
+        ``_get_invader_payables``.
+        """
+        return {record: record._get_invader_payables() for record in self}
+
     @api.model
     def create(self, vals):
         record = super(PaymentTransaction, self).create(vals)
@@ -50,11 +101,167 @@ class PaymentTransaction(models.Model):
         Notify the invader_payable that the state of the transaction
         has changed
         """
+        with metrics.span("invader_payment.event_notification", self.env.cr):
+            if self.env.context.get("invader_payment_batch_notify"):
+                self._notify_state_changed_event_batch()
+                return
+            payables_map = self._get_invader_payables_map()
+            for record in self:
+                payables = payables_map.get(record)
+                if not payables:
+                    continue
+                for payable in payables:
+                    state = record.state
+                    event_name = "on_payment_transaction_{}".format(state)
+                    record._invader_notify_event(
+                        payable._event(event_name), event_name, payable
+                    )
+
+    def _notify_state_changed_event_batch(self):
+        """
+        Notify the invader_payables grouped by (payable model, new state)
+
+        Listeners are looked up once per group. The ones implementing
+        ``on_payment_transaction_batch_<state>`` receive the whole group as
+        recordsets ``(payables, transactions)``. The listeners only
+        implementing the per-record ``on_payment_transaction_<state>`` are
+        still called once per (payable, transaction) pair.
+
+        Enabled by the ``invader_payment_batch_notify`` context key, e.g. on
+        crons or webhooks writing the state of many transactions at once.
+        """
+        groups = OrderedDict()
+        payables_map = self._get_invader_payables_map()
         for record in self:
-            payables = record._get_invader_payables()
+            payables = payables_map.get(record)
             if not payables:
                 continue
             for payable in payables:
-                state = record.state
-                event_name = "on_payment_transaction_{}".format(state)
-                payable._event(event_name).notify(payable, record)
+                key = (payable._name, record.state)
+                groups.setdefault(key, []).append((payable, record))
+        for (_model, state), pairs in groups.items():
+            self._notify_state_changed_event_group(state, pairs)
+
+    def _notify_state_changed_event_group(self, state, pairs):
+        """
+        :param state: the new state of the transactions
+        :param pairs: list of (payable, transaction) sharing the same
+                      payable model
+        """
+        first_payable = pairs[0][0]
+        payables = first_payable.browse(
+            list(OrderedDict.fromkeys(p.id for p, _tx in pairs))
+        )
+        transactions = self.browse(
+            list(OrderedDict.fromkeys(tx.id for _p, tx in pairs))
+        )
+        batch_event_name = "on_payment_transaction_batch_{}".format(state)
+        event_name = "on_payment_transaction_{}".format(state)
+        transactions._invader_notify_event(
+            payables._event(batch_event_name), batch_event_name, payables
+        )
+        # adapter for the listeners only knowing the per-record signature
+        events = [
+            event
+            for event in payables._event(event_name).events
+            if not hasattr(event.__self__, batch_event_name)
+        ]
+        if not events:
+            return
+        for payable, transaction in pairs:
+            for event in events:
+                transaction._invader_call_event(event, event_name, payable)
+
+    def _invader_notify_event(self, collected_events, event_name, payables):
+        """
+        Notify the collected events with (payables, self), honouring the
+        execution mode declared by each listener.
+        """
+        for event in collected_events.events:
+            self._invader_call_event(event, event_name, payables)
+
+    def _invader_call_event(self, event, event_name, payables):
+        listener = event.__self__
+        mode = EVENT_MODE_SYNC
+        if hasattr(listener, "_invader_get_event_mode"):
+            mode = listener._invader_get_event_mode(event_name)
+        if mode == EVENT_MODE_SYNC:
+            event(payables, self)
+            return
+        if mode not in (EVENT_MODE_JOB, EVENT_MODE_POST_COMMIT):
+            raise ValueError("Unknown event mode {}".format(mode))
+        if hasattr(listener, "_invader_on_deferred_event"):
+            listener._invader_on_deferred_event(event_name, payables, self)
+        args = (listener._name, event_name, payables._name, payables.ids)
+        if mode == EVENT_MODE_JOB:
+            if hasattr(self, "with_delay"):
+                self.with_delay()._invader_run_deferred_event(*args)
+                return
+            _logger.warning(
+                "queue_job is not installed, %s of %s is run after commit",
+                event_name,
+                listener._name,
+            )
+        self._invader_run_deferred_event_after_commit(*args)
+
+    def _invader_run_deferred_event_after_commit(self, *args):
+        dbname = self.env.cr.dbname
+        uid = self.env.uid
+        context = dict(self.env.context)
+        transaction_ids = self.ids
+
+        def run_deferred_event():
+            try:
+                with api.Environment.manage(), registry(dbname).cursor() as cr:
+                    env = api.Environment(cr, uid, context)
+                    env["payment.transaction"].browse(
+                        transaction_ids
+                    )._invader_run_deferred_event(*args)
+            except Exception:
+                _logger.exception(
+                    "Error while running deferred payment event %s", args
+                )
+                with api.Environment.manage(), registry(dbname).cursor() as cr:
+                    env = api.Environment(cr, uid, context)
+                    env["payment.transaction"].browse(
+                        transaction_ids
+                    ).exists()._invader_deferred_event_failed(*args)
+
+        self.env.cr.postcommit.add(run_deferred_event)
+
+    def _invader_deferred_event_failed(self, *args):
+        """
+        The deferred event failed after commit: retry it from a queue job
+        when queue_job is installed, otherwise record the failure on the
+        transactions so it can be handled manually.
+        """
+        if hasattr(self, "with_delay"):
+            self.with_delay()._invader_run_deferred_event(*args)
+            return
+        listener_name, event_name = args[:2]
+        message = "Deferred event {} of {} failed".format(
+            event_name, listener_name
+        )
+        for transaction in self:
+            transaction.state_message = "\n".join(
+                filter(None, (transaction.state_message, message))
+            )
+
+    def _invader_run_deferred_event(
+        self, listener_name, event_name, payable_model, payable_ids
+    ):
+        """
+        Run the event ``event_name`` of the listener ``listener_name`` out
+        of the transaction that changed the state (after commit or in a
+        queue job). The ``invader_payment_deferred_event`` context key is set
+        so listeners know they run outside of the customer session.
+        """
+        transactions = self.with_context(
+            invader_payment_deferred_event=True
+        ).exists()
+        payables = transactions.env[payable_model].browse(payable_ids).exists()
+        if not transactions or not payables:
+            return
+        for event in payables._event(event_name).events:
+            if event.__self__._name == listener_name:
+                event(payables, transactions)
@@ -1,10 +1,24 @@
 # Copyright 2019 ACSONE SA/NV
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import logging
+import random
+import time
+
+from psycopg2 import OperationalError
+
 from odoo import _
 from odoo.exceptions import UserError
+from odoo.service.model import PG_CONCURRENCY_ERRORS_TO_RETRY
 
 from odoo.addons.component.core import Component
 
+from ..exceptions import NotReplayableResponse
+
+_logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+MAX_TRIES_ON_CONCURRENCY_FAILURE = 5
+
 
 class InvaderPaymentService(Component):
 
@@ -29,17 +43,106 @@ class InvaderPaymentService(Component):
         """
         return {"target": {"type": "string", "required": True, "allowed": []}}
 
+    def _invader_get_idempotency_key(self, params):
+        """
+        Return the idempotency key of the request, given by the
+        ``idempotency_key`` parameter or the ``Idempotency-Key`` header.
+        """
+        key = params.get("idempotency_key")
+        if not key:
+            request = getattr(self.work, "request", None)
+            if request:
+                key = request.httprequest.headers.get(IDEMPOTENCY_KEY_HEADER)
+        return key
+
+    def _invader_get_idempotency_key_validator(self):
+        return {"idempotency_key": {"type": "string"}}
+
+    def _invader_get_idempotency_scope(self, method):
+        """
+        Return the scope of the idempotency keys of a service method.
+        Extend it to bind the keys to the current customer/session.
+        """
+        return method
+
+    def _invader_idempotent_call(self, method, params, func):
+        """
+        Call ``func`` (returning the service response) at most once per
+        idempotency key. Without key, ``func`` is simply called.
+
+        A replayed request (same key, same scope) gets the stored response:
+        the provider is not called and no transaction is created. The keys
+        are removed after a TTL (see ``invader.payment.idempotency.key``).
+        A response raised with NotReplayableResponse is not stored.
+
+        :param method: name of the service method, e.g.
+                       'payment_stripe.confirm_payment'
+        :param params: the service parameters
+        :param func: callable without argument
+        """
+        key = self._invader_get_idempotency_key(params)
+        if not key:
+            try:
+                return func()
+            except NotReplayableResponse as e:
+                return e.response
+        params = {k: v for k, v in params.items() if k != "idempotency_key"}
+        return (
+            self.env["invader.payment.idempotency.key"]
+            .sudo()
+            ._call(
+                key, self._invader_get_idempotency_scope(method), params, func
+            )
+        )
+
+    def _invader_retry_on_concurrency_failure(self, func, env=None):
+        """
+        Call func in the current database transaction; on a concurrency
+        failure (serialization failure, deadlock...), the transaction is
+        rolled back and func is called again.
+
+        :param env: environment of the database transaction, if not the
+                    one of the service (e.g. on a cursor of its own)
+        """
+        env = env or self.env
+        cr = env.cr
+        tries = 0
+        while True:
+            try:
+                res = func()
+                env["base"].flush()
+                return res
+            except OperationalError as e:
+                if e.pgcode not in PG_CONCURRENCY_ERRORS_TO_RETRY:
+                    raise
+                tries += 1
+                if tries >= MAX_TRIES_ON_CONCURRENCY_FAILURE:
+                    raise
+                _logger.info(
+                    "%s, retry %d/%d",
+                    e.pgcode,
+                    tries,
+                    MAX_TRIES_ON_CONCURRENCY_FAILURE,
+                )
+                cr.rollback()
+                env.clear()
+                time.sleep(random.uniform(0.0, 0.1 * 2**tries))
+
     def _check_provider(self, acquirer_id, provider):
         """Check that the payment mode has the correct provider
         If the provider is not the same, raise an error
         """
-        acquirer = acquirer_id.sudo()
-        if acquirer.provider != provider:
+        if acquirer_id:
+            acquirer_provider = acquirer_id._invader_get_config()["provider"]
+        else:
+            # no payment mode (e.g. payment_mode_id=0)
+            acquirer_provider = acquirer_id.provider
+        if acquirer_provider != provider:
             raise UserError(
                 _(
                     "Payment mode acquirer mismatch should be "
                     "'{}' instead of '{}'."
-                ).format(provider, acquirer.provider)
+                ).format(provider, acquirer_provider)
             )
 
     def _get_transaction_validator(self):
@@ -93,3 +196,35 @@ class InvaderPaymentService(Component):
     # Provide a way to retrieve transactions through payable object
     def _to_json(self, transactions):
         return {"transactions": transactions.jsonify(self._json_parser())}
+
+    def _to_json_multi(self, payables):
+        """Bulk counterpart of ``_to_json`` for many payables
+
+        The transactions of all the payables are read and serialized at
+        once instead of once per payable.
+
+        :param payables: invader.payable recordset
+        :return: dict {payable: {"transactions": [...]}}, each value being
+                 what ``_to_json`` returns for the payable transactions
+        """
+        transactions_by_payable = {
+            payable: payable._invader_get_transactions()
+            for payable in payables
+        }
+        transactions = self.env["payment.transaction"].union(
+            *transactions_by_payable.values()
+        )
+        values_by_id = dict(
+            zip(transactions.ids, transactions.jsonify(self._json_parser()))
+        )
+        return {
+            payable: {
+                "transactions": [
+                    values_by_id[transaction_id]
+                    for transaction_id in payable_transactions.ids
+                ]
+            }
+            for payable, payable_transactions in (
+                transactions_by_payable.items()
+            )
+        }
@@ -0,0 +1,195 @@
+# Copyright 2019 ACSONE SA/NV
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Benchmark helpers of the invader payment endpoints
+
+Benchmarks are test cases tagged ``invader_benchmark``, excluded from the
+standard test runs::
+
+    odoo -d db \\
+        -u shopinvader_payment,shopinvader_payment_manual,shopinvader_payment_stripe \\
+        --test-enable --test-tags invader_benchmark --stop-after-init
+
+Environment variables:
+
+* ``INVADER_BENCHMARK_OUTPUT``: path of a JSON file receiving the results,
+  one entry per benchmark case and endpoint (latency percentiles, SQL
+  queries, memory peak). Existing entries of the file are kept, so the
+  results of many cases (or modules) end up in the same file.
+* ``INVADER_BENCHMARK_SCALE``: multiply the size of the generated data.
+"""
+import json
+import logging
+import math
+import os
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+_logger = logging.getLogger(__name__)
+
+OUTPUT_ENV = "INVADER_BENCHMARK_OUTPUT"
+SCALE_ENV = "INVADER_BENCHMARK_SCALE"
+
+
+def get_scale():
+    return max(int(os.environ.get(SCALE_ENV) or 1), 1)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values, None if empty"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(rank, 0)]
+
+
+def _to_ms(duration):
+    return None if duration is None else round(duration * 1000, 3)
+
+
+class BenchmarkRecorder(object):
+    """Collect the samples of the endpoints of a benchmark case"""
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = OrderedDict()
+
+    def _get_samples(self, endpoint):
+        return self.samples.setdefault(
+            endpoint, {"durations": [], "queries": [], "memory_peak": 0}
+        )
+
+    @contextmanager
+    def measure(self, endpoint, cr):
+        """Record the duration and the SQL queries of the enclosed block"""
+        samples = self._get_samples(endpoint)
+        start_queries = cr.sql_log_count
+        start = time.perf_counter()
+        yield
+        samples["durations"].append(time.perf_counter() - start)
+        samples["queries"].append(cr.sql_log_count - start_queries)
+
+    @contextmanager
+    def measure_memory(self, endpoint):
+        """Record the peak of memory allocated in the enclosed block
+
+        Kept apart from ``measure`` as tracing the allocations slows down
+        the execution.
+        """
+        samples = self._get_samples(endpoint)
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        # also resets the peak
+        tracemalloc.clear_traces()
+        try:
+            yield
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+        samples["memory_peak"] = max(samples["memory_peak"], peak)
+
+    def summary(self):
+        res = OrderedDict()
+        for endpoint, samples in self.samples.items():
+            durations = samples["durations"]
+            queries = samples["queries"]
+            res[endpoint] = OrderedDict(
+                [
+                    ("count", len(durations)),
+                    ("p50_ms", _to_ms(percentile(durations, 50))),
+                    ("p90_ms", _to_ms(percentile(durations, 90))),
+                    ("p99_ms", _to_ms(percentile(durations, 99))),
+                    ("max_ms", _to_ms(max(durations, default=None))),
+                    (
+                        "queries_mean",
+                        sum(queries) / len(queries) if queries else None,
+                    ),
+                    ("queries_max", max(queries, default=None)),
+                    ("memory_peak_kb", round(samples["memory_peak"] / 1024)),
+                ]
+            )
+        return res
+
+    def dump(self, path=None):
+        """Write the summary in the JSON file given by ``path`` or by
+        ``INVADER_BENCHMARK_OUTPUT``. Return the path, None if no file."""
+        path = path or os.environ.get(OUTPUT_ENV)
+        if not path:
+            return None
+        data = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+        data[self.name] = self.summary()
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        return path
+
+
+class BenchmarkMixin(object):
+    """Mixin of the benchmark test cases, to put first in the bases
+
+    ``benchmark_size`` is the number of payables (partners, carts...) to
+    generate, ``benchmark_acquirers`` the number of acquirers per provider.
+    The ``_benchmark_*`` cart helpers are for the shopinvader cart test
+    cases (``cart``, ``backend``, ``partner`` and ``work_on_services``).
+    """
+
+    benchmark_size = 20
+    benchmark_acquirers = 3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.benchmark = BenchmarkRecorder(
+            "{}.{}".format(cls.__module__, cls.__name__)
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        for endpoint, stats in cls.benchmark.summary().items():
+            _logger.info("benchmark %s: %s", endpoint, dict(stats))
+        cls.benchmark.dump()
+        super().tearDownClass()
+
+    @classmethod
+    def _get_benchmark_size(cls):
+        return cls.benchmark_size * get_scale()
+
+    def _benchmark(self, endpoint, func, args):
+        """Call ``func(arg)`` for each arg, the last call being used to
+        measure the memory and the other ones the latency and queries.
+        Return the results of the calls.
+        """
+        self.assertGreater(len(args), 1, "not enough benchmark arguments")
+        res = []
+        for arg in args[:-1]:
+            with self.benchmark.measure(endpoint, self.env.cr):
+                res.append(func(arg))
+        with self.benchmark.measure_memory(endpoint):
+            res.append(func(args[-1]))
+        return res
+
+    def _benchmark_copy_carts(self):
+        """Return ``_get_benchmark_size()`` copies of the cart of the case"""
+        carts = self.env["sale.order"].browse()
+        for __ in range(self._get_benchmark_size()):
+            carts |= self.cart.copy(
+                {
+                    "typology": "cart",
+                    "shopinvader_backend_id": self.backend.id,
+                }
+            )
+        return carts
+
+    def _benchmark_dispatch(self, usage, cart, method, params):
+        """Dispatch ``method`` of the service ``usage`` in the session of
+        the customer of ``cart``"""
+        with self.work_on_services(
+            partner=self.partner, shopinvader_session={"cart_id": cart.id}
+        ) as work:
+            return work.component(usage=usage).dispatch(method, params=params)
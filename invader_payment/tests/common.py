@@ -0,0 +1,64 @@
+# Copyright 2019 ACSONE SA/NV
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+from contextlib import contextmanager
+
+
+class QueryBudgetMixin(object):
+    """Assert an upper bound of the SQL queries run by a block
+
+    The budget is a base cost plus a cost per unit of the things the block
+    scales with (payment methods, transactions...). Running the same
+    assertion with different unit counts in a test also checks that the
+    difference of queries between the runs stays within the cost of the
+    added units, which makes N+1 regressions fail whatever the base::
+
+        for count in (1, 10):
+            ...
+            with self.assertQueryBudget(40, transactions=(1, count)):
+                service.dispatch("search")
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, base, **units):
+        """
+        :param base: number of queries not depending on the units
+        :param units: name=(cost per unit, number of units)
+        """
+        budget = base + sum(cost * count for cost, count in units.values())
+        env = self.env
+        # count the queries of the block only, from a cold cache
+        env["base"].flush()
+        env["base"].invalidate_cache()
+        start = env.cr.sql_log_count
+        yield
+        env["base"].flush()
+        count = env.cr.sql_log_count - start
+        self.assertLessEqual(
+            count,
+            budget,
+            "{} SQL queries exceed the budget of {} (base: {}, units: {})".format(
+                count, budget, base, units
+            ),
+        )
+        self._assertQueryBudgetDelta(base, units, count)
+
+    def _assertQueryBudgetDelta(self, base, units, count):
+        # samples of the test instance, by budget
+        samples = self.__dict__.setdefault("_query_budget_samples", {})
+        key = (base, tuple(sorted(units)))
+        previous = samples.get(key)
+        samples[key] = (units, count)
+        if not previous:
+            return
+        previous_units, previous_count = previous
+        delta_budget = sum(
+            cost * (units[name][1] - previous_units[name][1])
+            for name, (cost, __) in units.items()
+        )
+        delta = count - previous_count
+        self.assertLessEqual(
+            delta,
+            max(delta_budget, 0),
+            "{} more SQL queries from {} to {} exceed the {} of the "
+            "added units".format(delta, previous_units, units, delta_budget),
+        )
@@ -7,6 +7,7 @@ from cerberus import Validator
 
 from odoo.addons.base_rest.components.service import to_int
 from odoo.addons.component.core import AbstractComponent
+from odoo.addons.invader_payment import metrics
 
 _logger = logging.getLogger(__name__)
 
@@ -19,6 +20,10 @@ class PaymentManual(AbstractComponent):
     _description = (
         "REST Services for manual payments (bank transfer, check...)"
     )
+    _invader_static_validators = (
+        "_validator_add_payment",
+        "_validator_return_add_payment",
+    )
 
     @property
     def payment_service(self):
@@ -33,6 +38,9 @@ class PaymentManual(AbstractComponent):
             }
         }
         schema.update(self.payment_service._invader_get_target_validator())
+        schema.update(
+            self.payment_service._invader_get_idempotency_key_validator()
+        )
         return schema
 
     def _validator_return_add_payment(self):
@@ -41,15 +49,26 @@ class PaymentManual(AbstractComponent):
 
     def add_payment(self, target, payment_mode_id, **params):
         """Prepare data for Manual payment submission"""
-        transaction_obj = self.env["payment.transaction"]
-        payable = self.payment_service._invader_find_payable_from_target(
-            target, **params
+        return self.payment_service._invader_idempotent_call(
+            "payment_manual.add_payment",
+            dict(params, target=target, payment_mode_id=payment_mode_id),
+            lambda: self._add_payment(target, payment_mode_id, **params),
         )
+
+    def _add_payment(self, target, payment_mode_id, **params):
+        transaction_obj = self.env["payment.transaction"]
+        cr = self.env.cr
+        with metrics.span("payment_manual.payable_resolution", cr):
+            payable = self.payment_service._invader_find_payable_from_target(
+                target, **params
+            )
         acquirer = self.env["payment.acquirer"].browse(payment_mode_id)
-        self.payment_service._check_provider(acquirer, "transfer")
+        with metrics.span("payment_manual.provider_check", cr):
+            self.payment_service._check_provider(acquirer, "transfer")
 
-        transaction = transaction_obj.create(
-            payable._invader_prepare_payment_transaction_data(acquirer)
-        )
-        transaction.write({"state": "pending"})
+        with metrics.span("payment_manual.transaction_create", cr):
+            transaction = transaction_obj.create(
+                payable._invader_prepare_payment_transaction_data(acquirer)
+            )
+            transaction.write({"state": "pending"})
         return {}
@@ -1 +1 @@
-from . import services
+from . import models, services, wizards
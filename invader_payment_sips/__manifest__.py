@@ -4,12 +4,18 @@
 {
     "name": "SIPS Payment Acquirer (REST, Base)",
     "summary": "REST Services for Worldline SIPS Payments (base module)",
-    "version": "13.0.1.0.0",
+    "version": "14.0.1.0.0",
     "author": "ACSONE SA/NV",
     "website": "https://github.com/shopinvader/odoo-shopinvader-payment",
     "license": "AGPL-3",
     "category": "e-commerce",
     "depends": ["invader_payment", "payment_sips", "base_rest"],
     "external_dependencies": {"python": ["cerberus"]},
-    "installable": False,
+    "data": [
+        "security/security.xml",
+        "data/ir_cron.xml",
+        "views/payment_acquirer.xml",
+        "wizards/invader_sips_report_import.xml",
+    ],
+    "installable": True,
 }
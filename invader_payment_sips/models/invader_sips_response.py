@@ -0,0 +1,154 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+import threading
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+from ..services.payment_sips import _sips_parse_data
+
+_logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+DEFAULT_TTL_HOURS = 24 * 7
+
+
+class InvaderSipsResponse(models.Model):
+
+    _name = "invader.sips.response"
+    _description = "SIPS automatic responses to process"
+    _log_access = False
+    _order = "id desc"
+
+    reference = fields.Char(required=True, readonly=True, index=True)
+    data = fields.Text(required=True, readonly=True)
+    seal = fields.Char(required=True, readonly=True)
+    transaction_id = fields.Many2one(
+        "payment.transaction", readonly=True, ondelete="cascade"
+    )
+    date = fields.Datetime(
+        required=True, readonly=True, default=fields.Datetime.now
+    )
+    state = fields.Selection(
+        [("pending", "Pending"), ("done", "Done"), ("error", "Error")],
+        required=True,
+        readonly=True,
+        index=True,
+        default="pending",
+    )
+    error_message = fields.Text(readonly=True)
+
+    @api.model
+    def _store_response(self, transaction, data, seal):
+        """
+        Store a (checked) SIPS automatic response, to be applied by
+        ``_cron_process_responses``
+
+        :param transaction: payment.transaction of the response
+        :return: the new invader.sips.response
+        """
+        return self.create(
+            {
+                "reference": transaction.reference,
+                "data": data,
+                "seal": seal,
+                "transaction_id": transaction.id,
+            }
+        )
+
+    def _process_responses(self):
+        """
+        Apply the responses to their transactions
+
+        The transactions are locked at once; the ones locked by the return
+        of the customer are left to it. The transactions are updated by
+        state, the listeners being notified once per state
+        (``invader_payment_batch_notify``).
+        """
+        transaction_obj = self.env["payment.transaction"].with_context(
+            invader_payment_batch_notify=True
+        )
+        locked = transaction_obj._invader_sips_lock_transactions(
+            list(set(self.mapped("reference"))), skip_locked=True
+        )
+        to_done = transaction_obj
+        to_cancel = transaction_obj
+        processed = self.browse()
+        for response in self.sorted("id"):
+            transaction = locked.get(response.reference, (None,))[0]
+            if not transaction:
+                # being processed by the return of the customer
+                continue
+            processed |= response
+            if transaction.state != "draft" or transaction in (
+                to_done | to_cancel
+            ):
+                # already processed
+                continue
+            values, success = transaction._invader_sips_response_values(
+                _sips_parse_data(response.data)
+            )
+            transaction.write(values)
+            if success:
+                to_done |= transaction
+            else:
+                to_cancel |= transaction
+        to_done._set_transaction_done()
+        to_cancel._set_transaction_cancel()
+        processed.write({"state": "done"})
+
+    @api.model
+    def _lock_pending_responses(self, limit):
+        # responses locked by another worker are left to it
+        self.env.cr.execute(
+            """
+            SELECT id FROM invader_sips_response
+            WHERE state = 'pending'
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (limit,),
+        )
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def _cron_process_responses(self, batch_size=BATCH_SIZE):
+        """Process the pending responses by batches, one commit per batch"""
+        last_ids = None
+        while True:
+            responses = self._lock_pending_responses(batch_size)
+            if not responses or responses.ids == last_ids:
+                # nothing left, or only responses of transactions locked
+                break
+            last_ids = responses.ids
+            try:
+                with self.env.cr.savepoint():
+                    responses._process_responses()
+            except Exception:
+                _logger.exception(
+                    "Error processing SIPS responses, retrying one by one"
+                )
+                for response in responses:
+                    try:
+                        with self.env.cr.savepoint():
+                            response._process_responses()
+                    except Exception as e:
+                        response.write(
+                            {"state": "error", "error_message": str(e)}
+                        )
+            if not getattr(threading.current_thread(), "testing", False):
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+
+    @api.model
+    def _gc_done_responses(self):
+        """Remove the done responses older than the TTL (in hours)"""
+        ttl = int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("invader_payment_sips.response_ttl", DEFAULT_TTL_HOURS)
+        )
+        limit = fields.Datetime.now() - timedelta(hours=ttl)
+        self.search([("state", "=", "done"), ("date", "<", limit)]).unlink()
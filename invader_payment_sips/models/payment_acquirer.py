@@ -0,0 +1,66 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, fields, models, tools
+from odoo.tools import frozendict
+
+from ..services.payment_sips import SIPS_CURRENCY_CODES
+
+
+class PaymentAcquirer(models.Model):
+
+    _inherit = "payment.acquirer"
+
+    sips_async_automatic_response = fields.Boolean(
+        string="SIPS Asynchronous Automatic Response",
+        help="The automatic responses of SIPS are only checked and stored, "
+        "to be applied by batch by a cron. The return of the customer is "
+        "still processed at once.",
+    )
+
+    def _invader_get_config_values(self):
+        values = super()._invader_get_config_values()
+        if self.provider == "sips":
+            values.update(
+                {
+                    "sips_secret": self.sips_secret,
+                    "sips_merchant_id": self.sips_merchant_id,
+                    "sips_version": self.sips_version,
+                    "sips_form_action_url": self.sips_get_form_action_url(),
+                }
+            )
+        return values
+
+    def _invader_get_sips_context(self):
+        """
+        Return an immutable context of the SIPS requests of the acquirer
+        (merchant, key version, currencies...), cached per worker until the
+        next write on a ``payment.acquirer`` or change of the
+        ``sips.key_version`` parameter.
+
+        :return: frozendict
+        """
+        self.ensure_one()
+        key_version = (
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("sips.key_version", "2")
+        )
+        return self._invader_get_sips_context_snapshot(self.id, key_version)
+
+    @api.model
+    @tools.ormcache("acquirer_id", "key_version")
+    def _invader_get_sips_context_snapshot(self, acquirer_id, key_version):
+        config = self.browse(acquirer_id)._invader_get_config()
+        assert config["provider"] == "sips"
+        return frozendict(
+            {
+                "merchant_id": config["sips_merchant_id"],
+                "key_version": key_version,
+                "interface_version": config["sips_version"],
+                "form_action_url": config["sips_form_action_url"],
+                "secret": config["sips_secret"],
+                # currency name: (SIPS code, amount multiplier)
+                "currencies": frozendict(SIPS_CURRENCY_CODES),
+            }
+        )
@@ -0,0 +1,504 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+import threading
+from datetime import timedelta
+
+import dateutil
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+
+from ..services.payment_sips import _sips_parse_data, _sips_seal_check
+from ..sips_office_client import DEFAULT_URL, get_client
+
+_logger = logging.getLogger(__name__)
+
+REPORT_CHUNK_SIZE = 500
+# references of the conflicting transactions kept in the import stats
+REPORT_MAX_CONFLICT_REFERENCES = 100
+SIPS_OFFICE_URL_PARAM = "invader_payment_sips.office_url"
+# transactionStatus of SIPS Office of the successful payments
+SIPS_OFFICE_SUCCESS_STATUSES = ("TO_VALIDATE", "TO_CAPTURE", "CAPTURED")
+SIPS_OFFICE_FAILED_STATUSES = ("REFUSED", "CANCELLED", "EXPIRED")
+
+# states from which a line of a SIPS report sets the transaction
+# done (successful payment) or cancel
+SIPS_REPORT_FROM_STATES = ("draft", "pending")
+# states agreeing with a line of a SIPS report, by success; the other ones
+# are left to a manual review
+SIPS_REPORT_AGREEING_STATES = {
+    True: ("authorized", "done"),
+    False: ("cancel", "error"),
+}
+
+
+class PaymentTransaction(models.Model):
+
+    _inherit = "payment.transaction"
+
+    @api.model
+    def _invader_sips_lock_transactions(self, references, skip_locked=False):
+        """
+        Lock the transactions of the references, reading the provider, the
+        secret and the asynchronous automatic response flag of their
+        acquirer in the same query.
+        With skip_locked, the transactions locked (being processed by a
+        concurrent response) are left out.
+        :param references: list of strings
+        :return: dict {reference: (payment.transaction, provider, secret,
+                 async_response)}
+        """
+        if not references:
+            return {}
+        query = """
+            SELECT tx.reference, tx.id, acquirer.provider, acquirer.sips_secret,
+                acquirer.sips_async_automatic_response
+            FROM payment_transaction tx
+            JOIN payment_acquirer acquirer ON acquirer.id = tx.acquirer_id
+            WHERE tx.reference IN %s
+            FOR UPDATE OF tx
+        """
+        if skip_locked:
+            query += " SKIP LOCKED"
+        self.flush(["reference", "acquirer_id", "state"])
+        self.env["payment.acquirer"].flush(
+            ["provider", "sips_secret", "sips_async_automatic_response"]
+        )
+        self.env.cr.execute(query, (tuple(references),))
+        res = {
+            reference: (
+                self.browse(transaction_id),
+                provider,
+                secret,
+                async_response,
+            )
+            for (
+                reference,
+                transaction_id,
+                provider,
+                secret,
+                async_response,
+            ) in self.env.cr.fetchall()
+        }
+        # the states may have been changed by the responses holding the locks
+        self.invalidate_cache(ids=[tx.id for tx, *__ in res.values()])
+        return res
+
+    @api.model
+    def _invader_sips_lock_transaction(self, reference, skip_locked=False):
+        """
+        Return the transaction of the reference, locked, with the provider,
+        the secret and the asynchronous automatic response flag of its
+        acquirer, in one query.
+        With skip_locked, an empty recordset is returned when the
+        transaction is locked (being processed by a concurrent response).
+        :param reference: string
+        :return: (payment.transaction, provider, sips_secret, async_response)
+        """
+        return self._invader_sips_lock_transactions(
+            [reference], skip_locked=skip_locked
+        ).get(reference, (self.browse(), None, None, False))
+
+    @api.model
+    def _invader_sips_parse_response(self, data, seal):
+        """
+        :return: the parsed Data of the SIPS response, with a reference
+        """
+        INVALID_DATA = _("invalid data")
+        if not data or not seal:
+            _logger.warning(
+                "invalid SIPS automatic response: missing data or seal"
+            )
+            raise UserError(INVALID_DATA)
+        data_o = _sips_parse_data(data)
+        if not data_o.get("transactionReference"):
+            _logger.warning(
+                "no transaction reference in SIPS automatic response"
+            )
+            raise UserError(INVALID_DATA)
+        return data_o
+
+    def _invader_sips_check_response(self, data, seal, provider, secret):
+        """
+        Check the transaction of a SIPS response and the seal of its Data
+        :param provider: the provider of the transaction acquirer
+        :param secret: the SIPS secret of the transaction acquirer
+        """
+        INVALID_DATA = _("invalid data")
+        reference = _sips_parse_data(data).get("transactionReference")
+        if len(self) != 1:
+            _logger.warning(
+                "transaction with reference '%s' not found in "
+                "SIPS automatic response",
+                reference,
+            )
+            raise UserError(INVALID_DATA)
+        if provider != "sips":
+            _logger.warning(
+                "transaction with reference '%s' has wrong provider "
+                "in SIPS automatic response",
+                reference,
+            )
+            raise UserError(INVALID_DATA)
+        if not _sips_seal_check(data, seal, secret):
+            _logger.warning(
+                "invalid seal '%s' for data '%s' in SIPS automatic response",
+                seal,
+                data,
+            )
+            raise UserError(INVALID_DATA)
+
+    @api.model
+    def _invader_sips_process_response(
+        self,
+        data,
+        seal,
+        in_customer_session=False,
+        skip_locked=False,
+        store_async=False,
+    ):
+        """
+        Check a SIPS response and apply it to its transaction, locked during
+        the processing. The concurrent responses of the same transaction
+        are serialized: once the first one is applied, the next ones are
+        no-ops. With skip_locked, a response arriving while another one is
+        processed is dropped at once.
+        With store_async, the response is only stored (see
+        invader.sips.response) if the acquirer has the asynchronous
+        automatic response.
+        :param data: the Data of the SIPS response
+        :param seal: the Seal of the SIPS response
+        :param in_customer_session: True for the return of the customer
+        :return: payment.transaction (empty if skipped)
+        """
+        data_o = self._invader_sips_parse_response(data, seal)
+        reference = data_o["transactionReference"]
+        (
+            transaction,
+            provider,
+            secret,
+            async_response,
+        ) = self._invader_sips_lock_transaction(
+            reference, skip_locked=skip_locked
+        )
+        if (
+            not transaction
+            and skip_locked
+            and self.search_count([("reference", "=", reference)])
+        ):
+            _logger.info(
+                "transaction with reference '%s' is being processed, "
+                "SIPS automatic response skipped",
+                reference,
+            )
+            return transaction
+        transaction._invader_sips_check_response(data, seal, provider, secret)
+        if store_async and async_response:
+            # applied by batch, see invader.sips.response
+            self.env["invader.sips.response"].sudo()._store_response(
+                transaction, data, seal
+            )
+            return transaction
+        if not transaction._invader_sips_apply_response(data_o) and (
+            in_customer_session
+        ):
+            # If we are here this means the automatic response from SIPS
+            # came before the manual_response that comes through the browser.
+            # We want _confirm_and_invalidate_session() to run so the
+            # front receives last_sale and an empty cart.
+            transaction._notify_state_changed_event()
+        return transaction
+
+    def _invader_sips_response_values(self, data_o):
+        """
+        :param data_o: the parsed Data of the SIPS response
+        :return: (values to write on the transaction, success)
+        """
+        response_code = data_o.get("responseCode")
+        transaction_date_time = data_o.get(
+            "transactionDateTime", fields.Datetime.now()
+        )
+        if isinstance(transaction_date_time, str):
+            transaction_date_time = dateutil.parser.parse(
+                transaction_date_time
+            ).replace(tzinfo=None)
+        values = {
+            # XXX better field for acquirer_reference?
+            "acquirer_reference": data_o.get("transactionReference"),
+            "date": transaction_date_time,
+            "state_message": "SIPS response_code {}".format(response_code),
+        }
+        return values, response_code == "00"
+
+    def _invader_sips_apply_response(self, data_o):
+        """
+        Apply the outcome of a (checked) SIPS response to the transaction,
+        if still draft. If transaction is not draft, it means it has already
+        been processed by automatic_response or normal_return.
+        :param data_o: the parsed Data of the SIPS response
+        :return: True if applied
+        """
+        self.ensure_one()
+        if self.state != "draft":
+            return False
+        values, success = self._invader_sips_response_values(data_o)
+        self.write(values)
+        if success:
+            self._set_transaction_done()
+        else:
+            # XXX we may need to handle pending state?
+            self._set_transaction_cancel()
+        return True
+
+    @api.model
+    def _invader_sips_read_report(self, report_file):
+        """
+        Read a SIPS transaction report line by line
+
+        Each line holds the Data of a transaction (``key=value|...``).
+        :param report_file: file object (text or binary) or iterable of
+                            lines
+        :return: generator of the parsed lines (dict), None for the lines
+                 that can't be parsed
+        """
+        for line in report_file:
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                data_o = _sips_parse_data(line)
+            except ValueError:
+                data_o = {}
+            if not data_o.get("transactionReference") or (
+                "responseCode" not in data_o
+            ):
+                _logger.warning("invalid SIPS report line: %s", line)
+                data_o = None
+            yield data_o
+
+    @api.model
+    def _invader_sips_import_report(
+        self, report_file, chunk_size=REPORT_CHUNK_SIZE
+    ):
+        """
+        Import a SIPS transaction report, streamed line by line: the SIPS
+        transactions of the lines are looked up by chunks, and their state
+        corrected by batch (see ``_invader_sips_import_report_chunk``).
+        The cache is invalidated after each chunk, so the memory used does
+        not grow with the size of the report.
+        :param report_file: see _invader_sips_read_report
+        :return: dict of counters (lines, invalid, unknown, updated,
+                 conflicts) and the references of the first transactions
+                 conflicting with the report, to review manually
+                 (conflict_references, at most
+                 REPORT_MAX_CONFLICT_REFERENCES)
+        """
+        stats = {
+            "lines": 0,
+            "invalid": 0,
+            "unknown": 0,
+            "updated": 0,
+            "conflicts": 0,
+            "conflict_references": [],
+        }
+        chunk = {}
+        for data_o in self._invader_sips_read_report(report_file):
+            stats["lines"] += 1
+            if data_o is None:
+                stats["invalid"] += 1
+                continue
+            # the last line of a transaction wins
+            chunk[data_o["transactionReference"]] = data_o
+            if len(chunk) >= chunk_size:
+                self._invader_sips_import_report_chunk(chunk, stats)
+                chunk = {}
+        if chunk:
+            self._invader_sips_import_report_chunk(chunk, stats)
+        _logger.info("SIPS report imported: %s", stats)
+        return stats
+
+    @api.model
+    def _invader_sips_import_report_chunk(self, lines, stats):
+        """
+        Set done (successful payment) or cancel the draft and pending
+        transactions of the lines. The other transactions are left as is,
+        the ones conflicting with the report (canceled but paid...) being
+        logged and counted in the conflicts of the stats.
+        :param lines: dict {reference: parsed line}
+        :param stats: dict of counters, updated
+        """
+        transaction_obj = self.with_context(invader_payment_batch_notify=True)
+        transactions = transaction_obj.search(
+            [
+                ("reference", "in", list(lines)),
+                (
+                    "acquirer_id",
+                    "in",
+                    self.env[
+                        "payment.acquirer"
+                    ]._invader_get_provider_acquirer_ids("sips"),
+                ),
+            ]
+        )
+        stats["unknown"] += len(lines) - len(transactions)
+        to_done = transaction_obj
+        to_cancel = transaction_obj
+        for transaction in transactions:
+            values, success = transaction._invader_sips_response_values(
+                lines[transaction.reference]
+            )
+            if transaction.state in SIPS_REPORT_AGREEING_STATES[success]:
+                continue
+            if transaction.state not in SIPS_REPORT_FROM_STATES:
+                _logger.warning(
+                    "SIPS transaction %s is %s but has response code %s "
+                    "in the SIPS report, to review",
+                    transaction.reference,
+                    transaction.state,
+                    lines[transaction.reference]["responseCode"],
+                )
+                stats["conflicts"] += 1
+                references = stats["conflict_references"]
+                if len(references) < REPORT_MAX_CONFLICT_REFERENCES:
+                    references.append(transaction.reference)
+                continue
+            transaction.write(values)
+            if success:
+                to_done |= transaction
+            else:
+                to_cancel |= transaction
+        to_done._set_transaction_done()
+        to_cancel._set_transaction_cancel()
+        stats["updated"] += len(to_done) + len(to_cancel)
+        self.env["base"].flush()
+        self.invalidate_cache()
+
+    @api.model
+    def _invader_get_sips_office_client(self, acquirer):
+        """
+        Return the client of the SIPS Office API of the acquirer, with a
+        ``get_transaction_data(reference)`` method. Override it to plug
+        another client.
+        :param acquirer: payment.acquirer
+        """
+        context = acquirer._invader_get_sips_context()
+        url = (
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param(SIPS_OFFICE_URL_PARAM, DEFAULT_URL)
+        )
+        return get_client(
+            url,
+            context["merchant_id"],
+            context["secret"],
+            context["key_version"],
+        )
+
+    def _invader_sips_office_response(self, data, abandon_before):
+        """
+        Convert the SIPS Office data of the transaction to the Data of a
+        SIPS response
+        :param data: dict returned by get_transaction_data
+        :param abandon_before: datetime, the transactions unknown by SIPS
+                               created before are canceled
+        :return: the parsed Data of a SIPS response, None if the outcome of
+                 the transaction is not known yet
+        """
+        self.ensure_one()
+        response_code = None
+        status = data.get("transactionStatus")
+        if data.get("responseCode") == "00":
+            if status in SIPS_OFFICE_SUCCESS_STATUSES:
+                response_code = "00"
+            elif status in SIPS_OFFICE_FAILED_STATUSES:
+                response_code = status
+        elif data.get("responseCode") == "25" and (
+            self.create_date < abandon_before
+        ):
+            # the customer never went to the payment page
+            response_code = "25"
+        if not response_code:
+            return None
+        data_o = {
+            "transactionReference": self.reference,
+            "responseCode": response_code,
+        }
+        if data.get("transactionDateTime"):
+            data_o["transactionDateTime"] = data["transactionDateTime"]
+        return data_o
+
+    def _invader_sips_poll_transactions(self, abandon_before):
+        """
+        Query the status of the transactions on SIPS Office, then apply the
+        known outcomes as SIPS responses (see _invader_sips_apply_response)
+        to the transactions, locked once all the calls are done.
+        :return: the updated transactions
+        """
+        responses = {}
+        for transaction in self:
+            client = self._invader_get_sips_office_client(
+                transaction.acquirer_id
+            )
+            try:
+                data = client.get_transaction_data(transaction.reference)
+            except Exception:
+                _logger.warning(
+                    "Unable to get the SIPS transaction %s",
+                    transaction.reference,
+                    exc_info=True,
+                )
+                # retried by the next run, whatever its age: the payment
+                # may be done
+                continue
+            data_o = transaction._invader_sips_office_response(
+                data, abandon_before
+            )
+            if data_o:
+                responses[transaction.reference] = data_o
+        locked = self.with_context(
+            invader_payment_batch_notify=True
+        )._invader_sips_lock_transactions(list(responses), skip_locked=True)
+        updated = self.browse()
+        for reference, (transaction, *__) in locked.items():
+            if transaction._invader_sips_apply_response(responses[reference]):
+                updated |= transaction
+        return updated
+
+    @api.model
+    def _cron_poll_sips_transactions(
+        self, chunk_size=100, min_age_minutes=30, abandon_hours=24
+    ):
+        """
+        Poll SIPS Office for the SIPS transactions still draft after
+        min_age_minutes (automatic response lost...), by chunks, one commit
+        per chunk. The ones unknown by SIPS after abandon_hours are canceled;
+        the ones SIPS Office can't be asked for are left for the next run.
+        """
+        now = fields.Datetime.now()
+        domain = [
+            ("state", "=", "draft"),
+            ("create_date", "<", now - timedelta(minutes=min_age_minutes)),
+            (
+                "acquirer_id",
+                "in",
+                self.env[
+                    "payment.acquirer"
+                ]._invader_get_provider_acquirer_ids("sips"),
+            ),
+        ]
+        abandon_before = now - timedelta(hours=abandon_hours)
+        last_id = 0
+        while True:
+            transactions = self.search(
+                domain + [("id", ">", last_id)], order="id", limit=chunk_size
+            )
+            if not transactions:
+                break
+            last_id = transactions[-1].id
+            transactions._invader_sips_poll_transactions(abandon_before)
+            if not getattr(threading.current_thread(), "testing", False):
+                self.env.cr.commit()  # pylint: disable=invalid-commit
@@ -4,24 +4,22 @@
 import logging
 from hashlib import sha256
 
-import dateutil
 from cerberus import Validator
 
-from odoo import _, fields
-from odoo.exceptions import UserError
-
 from odoo.addons.base_rest.components.service import to_int
 from odoo.addons.component.core import AbstractComponent
+from odoo.addons.invader_payment import metrics
 
 _logger = logging.getLogger(__name__)
 
+# currency name: (SIPS code, amount multiplier, i.e. 10 ** decimals)
 SIPS_CURRENCY_CODES = {
     "EUR": ("978", 100),
     "USD": ("840", 100),
     "CHF": ("756", 100),
     "GBP": ("826", 100),
     "CAD": ("124", 100),
-    "JPY": ("392", 100),
+    "JPY": ("392", 1),
     "MXN": ("484", 100),
     "TRY": ("949", 100),
     "AUD": ("036", 100),
@@ -61,6 +59,14 @@ class PaymentServiceSips(AbstractComponent):
     _inherit = "base.rest.service"
     _usage = "payment_sips"
     _description = "REST Services for SIPS payments"
+    _invader_static_validators = (
+        "_validator_prepare_payment",
+        "_validator_return_prepare_payment",
+        "_validator_automatic_response",
+        "_validator_return_automatic_response",
+        "_validator_normal_return",
+        "_validator_return_normal_return",
+    )
 
     @property
     def payment_service(self):
@@ -79,6 +85,9 @@ class PaymentServiceSips(AbstractComponent):
             "automatic_response_url": {"type": "string"},
         }
         schema.update(self.payment_service._invader_get_target_validator())
+        schema.update(
+            self.payment_service._invader_get_idempotency_key_validator()
+        )
         return schema
 
     def _validator_return_prepare_payment(self):
@@ -97,52 +106,77 @@ class PaymentServiceSips(AbstractComponent):
         automatic_response_url,
         **params
     ):
-        """ Prepare data for SIPS payment submission """
-        payable = self.payment_service._invader_find_payable_from_target(
-            target, **params
+        """Prepare data for SIPS payment submission"""
+        return self.payment_service._invader_idempotent_call(
+            "payment_sips.prepare_payment",
+            dict(
+                params,
+                target=target,
+                payment_mode_id=payment_mode_id,
+                normal_return_url=normal_return_url,
+                automatic_response_url=automatic_response_url,
+            ),
+            lambda: self._prepare_payment(
+                target,
+                payment_mode_id,
+                normal_return_url,
+                automatic_response_url,
+                **params
+            ),
         )
 
-        acquirer = self.env["payment.acquirer"].browse(payment_mode_id)
-        self.payment_service._check_provider(acquirer, "sips")
+    def _prepare_payment(
+        self,
+        target,
+        payment_mode_id,
+        normal_return_url,
+        automatic_response_url,
+        **params
+    ):
+        cr = self.env.cr
+        with metrics.span("payment_sips.payable_resolution", cr):
+            payable = self.payment_service._invader_find_payable_from_target(
+                target, **params
+            )
 
-        transaction_data = payable._invader_prepare_payment_transaction_data(
-            acquirer
-        )
+        acquirer = self.env["payment.acquirer"].browse(payment_mode_id)
+        with metrics.span("payment_sips.provider_check", cr):
+            self.payment_service._check_provider(acquirer, "sips")
 
-        transaction = self.env["payment.transaction"].create(transaction_data)
-        data = _sips_make_data(
-            self._prepare_sips_data(
-                transaction, normal_return_url, automatic_response_url
+        with metrics.span("payment_sips.transaction_create", cr):
+            transaction = self.env["payment.transaction"].create(
+                payable._invader_prepare_payment_transaction_data(acquirer)
             )
-        )
-        seal = _sips_make_seal(data, acquirer.sips_secret)
-        return {
-            "sips_form_action_url": acquirer.sips_get_form_action_url(),
-            "sips_data": data,
-            "sips_seal": seal,
-            "sips_interface_version": acquirer.sips_version,
-        }
+        with metrics.span("payment_sips.response_building", cr):
+            data = _sips_make_data(
+                self._prepare_sips_data(
+                    transaction, normal_return_url, automatic_response_url
+                )
+            )
+            context = acquirer._invader_get_sips_context()
+            seal = _sips_make_seal(data, context["secret"])
+            return {
+                "sips_form_action_url": context["form_action_url"],
+                "sips_data": data,
+                "sips_seal": seal,
+                "sips_interface_version": context["interface_version"],
+            }
 
     def _prepare_sips_data(
         self, transaction, normal_return_url, automatic_response_url
     ):
         # https://documentation.sips.worldline.com/en/WLSIPS.001-GD-Data-dictionary.html
-        acquirer = transaction.acquirer_id
-        assert acquirer.provider == "sips"
+        context = transaction.acquirer_id._invader_get_sips_context()
         data = {}
 
-        currency_code, currency_mult = SIPS_CURRENCY_CODES[
+        currency_code, currency_mult = context["currencies"][
             transaction.currency_id.name
         ]
-        data["amount"] = int(transaction.amount * currency_mult)
+        data["amount"] = int(round(transaction.amount * currency_mult))
         data["currencyCode"] = currency_code
         data["transactionReference"] = transaction.reference
-        data["merchantId"] = acquirer.sips_merchant_id
-        data["keyVersion"] = (
-            self.env["ir.config_parameter"]
-            .sudo()
-            .get_param("sips.key_version", "2")
-        )
+        data["merchantId"] = context["merchant_id"]
+        data["keyVersion"] = context["key_version"]
         data["normalReturnUrl"] = normal_return_url
         data["automaticResponseUrl"] = automatic_response_url
         return data
@@ -159,76 +193,25 @@ class PaymentServiceSips(AbstractComponent):
         return {}
 
     def _process_response(self, in_customer_session, **params):
-        INVALID_DATA = _("invalid data")
-        data = params.get("Data")
-        seal = params.get("Seal")
-        if not data or not seal:
-            _logger.warning(
-                "invalid SIPS automatic response: missing data or seal"
-            )
-            raise UserError(INVALID_DATA)
-        data_o = _sips_parse_data(data)
-        reference = data_o.get("transactionReference")
-        if not reference:
-            _logger.warning(
-                "no transaction reference in SIPS automatic response"
+        """
+        Apply the SIPS response to its transaction (see
+        payment.transaction._invader_sips_process_response), retried on
+        concurrency failures. The automatic response skips a transaction
+        locked by the return of the customer (and vice versa, the return of
+        the customer waits for the automatic response). With the
+        asynchronous automatic response of the acquirer, the automatic
+        response is only stored.
+        """
+        transaction_obj = self.env["payment.transaction"]
+        return self.payment_service._invader_retry_on_concurrency_failure(
+            lambda: transaction_obj._invader_sips_process_response(
+                params.get("Data"),
+                params.get("Seal"),
+                in_customer_session=in_customer_session,
+                skip_locked=not in_customer_session,
+                store_async=not in_customer_session,
             )
-            raise UserError(INVALID_DATA)
-        transaction = self.env["payment.transaction"].search(
-            [("reference", "=", reference)]
         )
-        if len(transaction) != 1:
-            _logger.warning(
-                "transaction with reference '%s' not found in "
-                "SIPS automatic response",
-                reference,
-            )
-            raise UserError(INVALID_DATA)
-        acquirer = transaction.acquirer_id
-        if acquirer.provider != "sips":
-            _logger.warning(
-                "transaction with reference '%s' has wrong provider "
-                "in SIPS automatic response"
-            )
-            raise UserError(INVALID_DATA)
-        if not _sips_seal_check(data, seal, acquirer.sips_secret):
-            _logger.warning(
-                "invalid seal '%s' for data '%s' in SIPS automatic response",
-                seal,
-                data,
-            )
-            raise UserError(INVALID_DATA)
-        response_code = data_o.get("responseCode")
-        success = response_code == "00"
-        if transaction.state == "draft":
-            # if transaction is not draft, it means it has already been
-            # processed by automatic_response or normal_return
-            transaction_date_time = data_o.get(
-                "transactionDateTime", fields.Datetime.now()
-            )
-            if isinstance(transaction_date_time, str):
-                transaction_date_time = dateutil.parser.parse(
-                    transaction_date_time
-                ).replace(tzinfo=None)
-            tx_data = {
-                # XXX better field for acquirer_reference?
-                "acquirer_reference": data_o.get("transactionReference"),
-                "date": transaction_date_time,
-                "state_message": "SIPS response_code {}".format(response_code),
-            }
-            transaction.write(tx_data)
-            if success:
-                transaction._set_transaction_done()
-            else:
-                # XXX we may need to handle pending state?
-                transaction._set_transaction_cancel()
-        elif in_customer_session:
-            # If we are here this means the automatic response from SIPS
-            # came before the manual_response that comes through the browser.
-            # We want _confirm_and_invalidate_session() to run so the
-            # front receives last_sale and an empty cart.
-            transaction._notify_state_changed_event()
-        return transaction
 
     def automatic_response(self, **params):
         """
@@ -0,0 +1,102 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Pooled clients of the SIPS Office (JSON) API
+
+The clients keep their own ``requests`` session, so the connections (and
+their TLS handshake) are reused by the next calls of the worker. They are
+created once per worker and configuration::
+
+    client = get_client(url, merchant_id, secret, key_version)
+    data = client.get_transaction_data("SO042-1")
+"""
+import hashlib
+import hmac
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_URL = "https://office-server.sips-services.com"
+DEFAULT_TIMEOUT = 30
+DEFAULT_POOL_SIZE = 10
+INTERFACE_VERSION = "DR_WS_2.20"
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _sips_office_make_seal(values, secret):
+    # HMAC-SHA256 of the values sorted by field name, keyVersion excluded
+    data = "".join(
+        str(values[key])
+        for key in sorted(values)
+        if key not in ("keyVersion", "seal", "sealAlgorithm")
+    )
+    return hmac.new(
+        secret.encode("utf-8"), data.encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+
+
+class SipsOfficeClient(object):
+    def __init__(
+        self,
+        url,
+        merchant_id,
+        secret,
+        key_version,
+        timeout=DEFAULT_TIMEOUT,
+        pool_size=DEFAULT_POOL_SIZE,
+    ):
+        self.url = url.rstrip("/")
+        self.merchant_id = merchant_id
+        self.secret = secret
+        self.key_version = key_version
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, path, values):
+        """Send a sealed request to SIPS Office and return the response"""
+        values = dict(
+            values,
+            interfaceVersion=INTERFACE_VERSION,
+            merchantId=self.merchant_id,
+        )
+        values["seal"] = _sips_office_make_seal(values, self.secret)
+        values["keyVersion"] = self.key_version
+        response = self.session.post(
+            "{}/{}".format(self.url, path), json=values, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def get_transaction_data(self, reference):
+        """
+        :return: dict, with the responseCode of the request ('00', '25' if
+                 the transaction is unknown...) and the transactionStatus
+        """
+        return self.request(
+            "rs-services/v2/diagnostic/getTransactionData",
+            {"transactionReference": reference},
+        )
+
+
+def get_client(
+    url,
+    merchant_id,
+    secret,
+    key_version,
+    timeout=DEFAULT_TIMEOUT,
+    pool_size=DEFAULT_POOL_SIZE,
+):
+    """Return the client of the worker for this configuration"""
+    key = (url, merchant_id, secret, key_version, timeout, pool_size)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = SipsOfficeClient(*key)
+    return client
@@ -0,0 +1,125 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Local stand-in of the SIPS Office API, for tests
+
+It answers the getTransactionData requests of ``sips_office_client`` from
+the transactions it is given, with a configurable latency and error rate::
+
+    with SipsOfficeStandIn(secret="...") as server:
+        server.transactions["SO042-1"] = {"transactionStatus": "CAPTURED"}
+        env["ir.config_parameter"].set_param(
+            "invader_payment_sips.office_url", server.url
+        )
+        ...
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from ..sips_office_client import _sips_office_make_seal
+
+GET_TRANSACTION_DATA_PATH = "/rs-services/v2/diagnostic/getTransactionData"
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class SipsOfficeStandInHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # keep the test logs quiet
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        stand_in = self.server.stand_in
+        length = int(self.headers.get("Content-Length") or 0)
+        values = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+        if stand_in.latency:
+            time.sleep(stand_in.latency)
+        if stand_in.error_rate and random.random() < stand_in.error_rate:
+            return self._send_json(500, {"responseCode": "99"})
+        if self.path != GET_TRANSACTION_DATA_PATH:
+            return self._send_json(404, {"responseCode": "30"})
+        if stand_in.secret and values.get("seal") != _sips_office_make_seal(
+            values, stand_in.secret
+        ):
+            return self._send_json(200, {"responseCode": "34"})
+        self._send_json(
+            200, stand_in.get_transaction_data(values["transactionReference"])
+        )
+
+
+class SipsOfficeStandIn(object):
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        secret=None,
+        latency=0.0,
+        error_rate=0.0,
+    ):
+        """
+        :param port: 0 to pick a free port
+        :param secret: if set, the seal of the requests is checked
+        :param latency: seconds added to each response
+        :param error_rate: ratio of requests answered with an error 500
+        """
+        self.secret = secret
+        self.latency = latency
+        self.error_rate = error_rate
+        # {transactionReference: data of the transaction}
+        self.transactions = {}
+        self.requests_count = 0
+        self._lock = threading.Lock()
+        self._server = _ThreadingHTTPServer(
+            (host, port), SipsOfficeStandInHandler
+        )
+        self._server.stand_in = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def get_transaction_data(self, reference):
+        with self._lock:
+            self.requests_count += 1
+            data = self.transactions.get(reference)
+        if data is None:
+            # unknown transaction
+            return {"responseCode": "25"}
+        return dict(data, responseCode="00", transactionReference=reference)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
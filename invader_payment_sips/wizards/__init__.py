@@ -0,0 +1 @@
+from . import invader_sips_report_import
@@ -0,0 +1,77 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import io
+
+from odoo import fields, models
+
+
+class InvaderSipsReportImport(models.TransientModel):
+
+    _name = "invader.sips.report.import"
+    _description = "Import a SIPS transaction report"
+
+    report_file = fields.Binary(attachment=True)
+    report_filename = fields.Char()
+    state = fields.Selection(
+        [("draft", "Draft"), ("done", "Done")], default="draft"
+    )
+    lines = fields.Integer(readonly=True)
+    invalid = fields.Integer(string="Invalid Lines", readonly=True)
+    unknown = fields.Integer(string="Unknown Transactions", readonly=True)
+    updated = fields.Integer(string="Updated Transactions", readonly=True)
+    conflicts = fields.Integer(
+        string="Transactions to Review",
+        readonly=True,
+        help="Transactions conflicting with the report (canceled but "
+        "paid...), left as is.",
+    )
+    conflict_references = fields.Text(
+        string="References to Review",
+        readonly=True,
+        help="References of the first transactions conflicting with the "
+        "report.",
+    )
+
+    def _open_report_file(self):
+        """
+        Open the uploaded report as a binary file object, read from the
+        filestore rather than decoded in memory when possible
+        """
+        attachment = (
+            self.env["ir.attachment"]
+            .sudo()
+            .search(
+                [
+                    ("res_model", "=", self._name),
+                    ("res_field", "=", "report_file"),
+                    ("res_id", "=", self.id),
+                ],
+                limit=1,
+            )
+        )
+        if attachment.store_fname:
+            return open(attachment._full_path(attachment.store_fname), "rb")
+        return io.BytesIO(attachment.raw or b"")
+
+    def action_import(self):
+        self.ensure_one()
+        with self._open_report_file() as report_file:
+            stats = self.env[
+                "payment.transaction"
+            ]._invader_sips_import_report(report_file)
+        self.write(
+            dict(
+                stats,
+                state="done",
+                report_file=False,
+                conflict_references="\n".join(stats["conflict_references"]),
+            )
+        )
+        return {
+            "type": "ir.actions.act_window",
+            "res_model": self._name,
+            "res_id": self.id,
+            "view_mode": "form",
+            "target": "new",
+        }
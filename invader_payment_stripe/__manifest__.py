@@ -9,7 +9,13 @@
     "website": "https://github.com/shopinvader/odoo-shopinvader-payment",
     "author": "ACSONE SA/NV",
     "license": "AGPL-3",
-    "external_dependencies": {"python": ["cerberus", "stripe"], "bin": []},
+    "external_dependencies": {"python": ["cerberus", "stripe<8"], "bin": []},
     "depends": ["invader_payment", "payment_stripe", "base_rest"],
+    "data": [
+        "security/security.xml",
+        "data/ir_cron.xml",
+        "views/payment_acquirer.xml",
+        "views/payment_transaction.xml",
+    ],
     "installable": True,
 }
@@ -0,0 +1,110 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Circuit breakers of the Stripe calls, one per worker and acquirer
+
+After ``failure_threshold`` consecutive failures (errors or calls slower
+than the latency budget), the circuit opens: the calls are refused for
+``reset_timeout`` seconds, so the workers do not all wait for a slow or
+unavailable Stripe. Then one trial call is allowed (half-open): its success
+closes the circuit, its failure opens it again.
+
+The state changes are counted in the metrics
+(``payment_stripe.circuit_breaker.<state>``).
+
+The breakers are kept in the memory of each worker process (shared by its
+threads), not between the workers: sharing them through the database would
+add a write, on a cursor of its own, to every Stripe call, and make the
+breaker depend on the database it protects from waiting workers. A failing
+Stripe is then called at most ``failure_threshold`` times per worker before
+all of them fail fast, and the reads are bounded by the latency budget
+(used as request timeout, see ``PaymentServiceStripe._get_stripe_client``).
+"""
+import threading
+import time
+
+from odoo.addons.invader_payment import metrics
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitBreaker(object):
+    def __init__(
+        self, name, failure_threshold=5, reset_timeout=30, latency_budget=0
+    ):
+        """
+        :param failure_threshold: consecutive failures opening the circuit,
+                                  0 to never open it
+        :param reset_timeout: seconds before a trial call once open
+        :param latency_budget: calls slower than this (in seconds) are
+                               failures, 0 for no budget
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.latency_budget = latency_budget
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            metrics.increment(
+                "payment_stripe.circuit_breaker.{}".format(state),
+                breaker=self.name,
+            )
+
+    def allow_request(self):
+        """Return whether a call can be done now"""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == STATE_OPEN:
+                if now - self.opened_at < self.reset_timeout:
+                    return False
+                self._set_state(STATE_HALF_OPEN)
+            elif now - self.trial_started_at < self.reset_timeout:
+                # a trial call is in progress
+                return False
+            self.trial_started_at = now
+            return True
+
+    def record_success(self, duration=0):
+        if self.latency_budget and duration > self.latency_budget:
+            self.record_failure()
+            return
+        with self._lock:
+            self.failures = 0
+            self._set_state(STATE_CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == STATE_HALF_OPEN or (
+                self.failure_threshold
+                and self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.monotonic()
+                self._set_state(STATE_OPEN)
+
+
+def get_breaker(name, failure_threshold=5, reset_timeout=30, latency_budget=0):
+    """Return the breaker of the worker for name, with this configuration"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(name)
+    breaker.failure_threshold = failure_threshold
+    breaker.reset_timeout = reset_timeout
+    breaker.latency_budget = latency_budget
+    return breaker
@@ -0,0 +1,39 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import json
+
+from odoo import http
+from odoo.exceptions import UserError
+from odoo.http import request
+
+
+class InvaderStripeWebhookController(http.Controller):
+    @http.route(
+        "/invader_payment_stripe/webhook/<int:acquirer_id>",
+        type="http",
+        auth="public",
+        methods=["POST"],
+        csrf=False,
+    )
+    def webhook(self, acquirer_id, **kwargs):
+        """
+        Endpoint of the Stripe webhook of an acquirer: the verified events
+        are stored to be processed by batch (see ``invader.stripe.event``).
+        """
+        httprequest = request.httprequest
+        try:
+            request.env["invader.stripe.event"].sudo()._receive_webhook(
+                acquirer_id,
+                httprequest.get_data(),
+                httprequest.headers.get("Stripe-Signature"),
+            )
+        except UserError:
+            return request.make_response(
+                json.dumps({"received": False}),
+                headers=[("Content-Type", "application/json")],
+                status=400,
+            )
+        return request.make_response(
+            json.dumps({"received": True}),
+            headers=[("Content-Type", "application/json")],
+        )
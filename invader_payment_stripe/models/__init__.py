@@ -0,0 +1,3 @@
+from . import payment_acquirer
+from . import payment_transaction
+from . import invader_stripe_event
@@ -0,0 +1,231 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+import json
+import logging
+import threading
+
+import psycopg2
+import stripe
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+
+from ..services.payment_stripe import stripe_status_to_state
+
+_logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+
+# payment.transaction state -> method setting it
+TRANSACTION_STATE_SETTERS = {
+    "pending": "_set_transaction_pending",
+    "authorized": "_set_transaction_authorized",
+    "done": "_set_transaction_done",
+    "cancel": "_set_transaction_cancel",
+}
+
+
+class InvaderStripeEvent(models.Model):
+
+    _name = "invader.stripe.event"
+    _description = "Stripe events received by the webhook"
+    _log_access = False
+    _order = "id desc"
+
+    event_id = fields.Char(required=True, readonly=True)
+    event_type = fields.Char(required=True, readonly=True)
+    created = fields.Integer(
+        readonly=True, help="Creation timestamp of the event on Stripe"
+    )
+    acquirer_id = fields.Many2one(
+        "payment.acquirer", required=True, readonly=True, ondelete="cascade"
+    )
+    intent_id = fields.Char(readonly=True, index=True)
+    intent_status = fields.Char(readonly=True)
+    payload = fields.Text(readonly=True)
+    date = fields.Datetime(
+        required=True, readonly=True, default=fields.Datetime.now
+    )
+    state = fields.Selection(
+        [
+            ("pending", "Pending"),
+            ("done", "Done"),
+            ("ignored", "Ignored"),
+            ("error", "Error"),
+        ],
+        required=True,
+        readonly=True,
+        index=True,
+        default="pending",
+    )
+    error_message = fields.Text(readonly=True)
+
+    _sql_constraints = [
+        (
+            "event_id_uniq",
+            "unique(event_id)",
+            "A Stripe event is stored only once",
+        )
+    ]
+
+    @api.model
+    def _prepare_event_values(self, event, acquirer):
+        obj = event.data.object
+        values = {
+            "event_id": event.id,
+            "event_type": event.type,
+            "created": event.created,
+            "acquirer_id": acquirer.id,
+            "payload": json.dumps(event.to_dict_recursive()),
+        }
+        if obj.get("object") == "payment_intent":
+            values.update({"intent_id": obj.id, "intent_status": obj.status})
+        elif obj.get("payment_intent"):
+            # charges, refunds, disputes...
+            values["intent_id"] = obj.payment_intent
+        return values
+
+    @api.model
+    def _store_event(self, event, acquirer):
+        """
+        Store a (verified) Stripe event to be processed by
+        ``_cron_process_events``. An event already received is not stored
+        again.
+
+        :param event: stripe.Event
+        :param acquirer: payment.acquirer
+        :return: the new invader.stripe.event, empty if already received
+        """
+        if self.search_count([("event_id", "=", event.id)]):
+            _logger.info("Stripe event %s already received", event.id)
+            return self.browse()
+        try:
+            with self.env.cr.savepoint():
+                return self.create(self._prepare_event_values(event, acquirer))
+        except psycopg2.IntegrityError:
+            # received concurrently
+            _logger.info("Stripe event %s already received", event.id)
+            return self.browse()
+
+    @api.model
+    def _receive_webhook(self, acquirer_id, payload, signature):
+        """
+        Check the signature of a webhook request with the webhook secret of
+        its acquirer, then store the event.
+
+        :param acquirer_id: id of the Stripe acquirer of the webhook url
+        :param payload: bytes (the raw request body)
+        :param signature: string (the Stripe-Signature header)
+        :return: the new invader.stripe.event, empty if already received
+        """
+        acquirer = self.env["payment.acquirer"].browse(acquirer_id)
+        acquirer_ids = acquirer._invader_get_provider_acquirer_ids("stripe")
+        secret = None
+        if acquirer_id in acquirer_ids:
+            secret = acquirer._invader_get_config().get(
+                "stripe_webhook_secret"
+            )
+        try:
+            if not secret or not signature:
+                raise ValueError("no webhook secret or signature")
+            event = stripe.Webhook.construct_event(payload, signature, secret)
+        except (ValueError, stripe.error.SignatureVerificationError):
+            _logger.warning(
+                "invalid Stripe webhook signature (acquirer %s)", acquirer_id
+            )
+            raise UserError(_("Invalid Stripe signature"))
+        _logger.info("Stripe webhook: %s %s", event.type, event.id)
+        return self._store_event(event, acquirer)
+
+    def _process_events(self):
+        """
+        Apply the intent statuses of the events to their transactions
+
+        The last event of each intent wins. The transactions are searched at
+        once, and updated by state, the listeners being notified once per
+        state (``invader_payment_batch_notify``).
+        """
+        intent_events = self.filtered(
+            lambda e: e.intent_id and e.intent_status
+        )
+        (self - intent_events).write({"state": "ignored"})
+        transaction_obj = self.env["payment.transaction"].with_context(
+            invader_payment_batch_notify=True
+        )
+        transactions = transaction_obj.search(
+            [
+                (
+                    "acquirer_reference",
+                    "in",
+                    list(set(intent_events.mapped("intent_id"))),
+                ),
+                (
+                    "acquirer_id",
+                    "in",
+                    self.env[
+                        "payment.acquirer"
+                    ]._invader_get_provider_acquirer_ids("stripe"),
+                ),
+            ]
+        )
+        transaction_by_intent = {
+            transaction.acquirer_reference: transaction
+            for transaction in transactions
+        }
+        last_events = {}
+        for event in intent_events.sorted(lambda e: (e.created, e.id)):
+            last_events[event.intent_id] = event
+        transactions_by_state = {}
+        for intent_id, event in last_events.items():
+            transaction = transaction_by_intent.get(intent_id)
+            state = stripe_status_to_state(event.intent_status)
+            if not transaction or state not in TRANSACTION_STATE_SETTERS:
+                continue
+            if transaction.state != state:
+                transactions_by_state[state] = (
+                    transactions_by_state.get(state, transaction_obj)
+                    | transaction
+                )
+        for state, state_transactions in transactions_by_state.items():
+            getattr(state_transactions, TRANSACTION_STATE_SETTERS[state])()
+        intent_events.write({"state": "done"})
+
+    @api.model
+    def _lock_pending_events(self, limit):
+        # events locked by another worker are left to it
+        self.env.cr.execute(
+            """
+            SELECT id FROM invader_stripe_event
+            WHERE state = 'pending'
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (limit,),
+        )
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def _cron_process_events(self, batch_size=BATCH_SIZE):
+        """Process the pending events by batches, one commit per batch"""
+        while True:
+            events = self._lock_pending_events(batch_size)
+            if not events:
+                break
+            try:
+                with self.env.cr.savepoint():
+                    events._process_events()
+            except Exception:
+                _logger.exception(
+                    "Error processing Stripe events, retrying one by one"
+                )
+                for event in events:
+                    try:
+                        with self.env.cr.savepoint():
+                            event._process_events()
+                    except Exception as e:
+                        event.write(
+                            {"state": "error", "error_message": str(e)}
+                        )
+            if not getattr(threading.current_thread(), "testing", False):
+                self.env.cr.commit()  # pylint: disable=invalid-commit
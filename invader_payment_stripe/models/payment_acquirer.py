@@ -0,0 +1,92 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import fields, models
+
+from ..stripe_client import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT
+
+
+class PaymentAcquirer(models.Model):
+
+    _inherit = "payment.acquirer"
+
+    stripe_timeout = fields.Integer(
+        string="Stripe Timeout",
+        default=DEFAULT_TIMEOUT,
+        help="Timeout (in seconds) of the requests sent to Stripe",
+    )
+    stripe_pool_size = fields.Integer(
+        string="Stripe Connection Pool Size",
+        default=DEFAULT_POOL_SIZE,
+        help="Maximum number of connections to Stripe kept open by each "
+        "worker",
+    )
+
+    stripe_api_base = fields.Char(
+        string="Stripe API Base",
+        help="Url of the Stripe API, to use a stand-in of the API (load "
+        "tests...). Leave empty to use the Stripe API.",
+    )
+    stripe_latency_budget = fields.Float(
+        string="Stripe Latency Budget",
+        help="Stripe calls slower than this (in seconds) count as failures "
+        "of the circuit breaker, and are aborted if it is lower than the "
+        "timeout. 0 for no budget.",
+    )
+    stripe_breaker_threshold = fields.Integer(
+        string="Stripe Circuit Breaker Threshold",
+        default=5,
+        help="Number of consecutive failed (or too slow) Stripe calls after "
+        "which the payments are refused without calling Stripe. 0 to "
+        "disable the circuit breaker.",
+    )
+    stripe_breaker_reset_timeout = fields.Integer(
+        string="Stripe Circuit Breaker Reset Timeout",
+        default=30,
+        help="Seconds during which the payments are refused once the circuit "
+        "breaker is open, before trying Stripe again",
+    )
+    stripe_two_phase_confirm = fields.Boolean(
+        string="Stripe Two-Phase Confirmation",
+        help="Commit the draft transaction before calling Stripe and apply "
+        "the result in a second database transaction, so the transaction "
+        "and the cart are not locked during the Stripe call",
+    )
+
+    stripe_capture_method = fields.Selection(
+        [
+            ("automatic", "Automatic"),
+            ("manual", "Manual (authorize only)"),
+        ],
+        string="Stripe Capture Method",
+        default="automatic",
+        required=True,
+        help="Manual: the payments are only authorized at checkout, and "
+        "captured later by batch (e.g. when the orders are shipped)",
+    )
+
+    def _invader_get_config_values(self):
+        values = super()._invader_get_config_values()
+        if self.provider == "stripe":
+            values.update(
+                {
+                    "stripe_secret_key": self.stripe_secret_key,
+                    "stripe_webhook_secret": self.stripe_webhook_secret,
+                    "stripe_timeout": self.stripe_timeout or DEFAULT_TIMEOUT,
+                    "stripe_pool_size": (
+                        self.stripe_pool_size or DEFAULT_POOL_SIZE
+                    ),
+                    "stripe_api_base": self.stripe_api_base or None,
+                    "stripe_two_phase_confirm": self.stripe_two_phase_confirm,
+                    "stripe_capture_method": (
+                        self.stripe_capture_method or "automatic"
+                    ),
+                    "capture_later": self.stripe_capture_method == "manual",
+                    "stripe_latency_budget": self.stripe_latency_budget,
+                    "stripe_breaker_threshold": self.stripe_breaker_threshold,
+                    "stripe_breaker_reset_timeout": (
+                        self.stripe_breaker_reset_timeout
+                    ),
+                }
+            )
+        return values
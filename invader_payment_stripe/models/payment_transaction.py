@@ -0,0 +1,299 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+from ..services.payment_stripe import stripe_status_to_state
+from ..stripe_client import get_client
+
+_logger = logging.getLogger(__name__)
+
+
+class PaymentTransaction(models.Model):
+
+    _inherit = "payment.transaction"
+
+    acquirer_reference = fields.Char(index=True)
+    invader_stripe_payment_method = fields.Char(
+        string="Stripe Payment Method",
+        readonly=True,
+        copy=False,
+    )
+    invader_stripe_client_confirm = fields.Boolean(
+        string="Stripe Intent Confirmed by the Client",
+        readonly=True,
+        copy=False,
+        help="The intent is created when the payment step is shown and "
+        "confirmed by the client, directly with Stripe",
+    )
+    invader_stripe_last_check = fields.Datetime(
+        string="Stripe Intent Last Check",
+        readonly=True,
+        copy=False,
+        help="Last time the intent of the pending transaction was fetched "
+        "by the reconciliation job",
+    )
+    invader_stripe_capture_requested = fields.Boolean(
+        string="Stripe Capture Requested",
+        readonly=True,
+        copy=False,
+        help="The authorized amount will be captured by the Stripe capture "
+        "job",
+    )
+    invader_stripe_to_review = fields.Boolean(
+        string="Stripe Payment to Review",
+        readonly=True,
+        copy=False,
+        help="The payment on Stripe does not match the amount to pay (changed "
+        "since the payment...): to check, and refund if needed",
+    )
+
+    @api.model
+    def _invader_get_stripe_transaction_from_intent(self, intent):
+        """
+        Return the Stripe transaction of a payment intent
+
+        A single query on the indexed acquirer_reference.
+
+        :param intent: string (the intent id)
+        :return: payment.transaction
+        """
+        # filter on the acquirer ids to use the acquirer_reference index
+        # without joining payment_acquirer
+        return self.search(
+            [
+                ("acquirer_reference", "=", intent),
+                (
+                    "acquirer_id",
+                    "in",
+                    self.env[
+                        "payment.acquirer"
+                    ]._invader_get_provider_acquirer_ids("stripe"),
+                ),
+            ],
+            limit=1,
+        )
+
+    def _invader_stripe_flag_to_review(self, message):
+        """
+        Flag the transactions of which the Stripe payment is to review
+        :param message: string, the reason
+        """
+        for transaction in self:
+            _logger.error(
+                "Stripe transaction %s to review: %s",
+                transaction.reference,
+                message,
+            )
+        self.write(
+            {"invader_stripe_to_review": True, "state_message": message}
+        )
+
+    def _invader_get_stripe_client(self):
+        self.ensure_one()
+        config = self.acquirer_id._invader_get_config()
+        return get_client(
+            config["stripe_secret_key"],
+            timeout=config["stripe_timeout"],
+            pool_size=config["stripe_pool_size"],
+            api_base=config["stripe_api_base"],
+        )
+
+    def _invader_call_stripe_intents(self, method_name, max_workers):
+        """
+        Call a method of the StripeClient (e.g. 'retrieve_payment_intent')
+        for the intent of each transaction, at most max_workers at a time.
+        The threads only do the http calls.
+
+        :return: dict {transaction: intent}, without the failed calls
+        """
+        calls = [
+            (
+                transaction,
+                transaction._invader_get_stripe_client(),
+                transaction.acquirer_reference,
+            )
+            for transaction in self
+        ]
+
+        def call_stripe(call):
+            transaction, client, intent_id = call
+            try:
+                return (
+                    transaction,
+                    getattr(client, method_name)(intent_id),
+                )
+            except Exception:
+                _logger.warning(
+                    "Error on %s of Stripe intent %s",
+                    method_name,
+                    intent_id,
+                    exc_info=True,
+                )
+                return transaction, None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(call_stripe, calls))
+        return {
+            transaction: intent for transaction, intent in results if intent
+        }
+
+    def _invader_reconcile_stripe_intents(self, abandon_before, max_workers):
+        """
+        Apply the status of the Stripe intents to the pending transactions,
+        by batch. The intents of the transactions still pending and created
+        before abandon_before are canceled on Stripe, then the transactions
+        once Stripe reports them canceled. The processing intents (SEPA
+        debits...) are never abandoned: they can still succeed.
+
+        :return: the transactions no longer pending
+        """
+        intents = self._invader_call_stripe_intents(
+            "retrieve_payment_intent", max_workers
+        )
+        transaction_obj = self.browse().with_context(
+            invader_payment_batch_notify=True
+        )
+        to_done = transaction_obj
+        to_authorized = transaction_obj
+        to_cancel = transaction_obj
+        to_abandon = transaction_obj
+        for transaction in self:
+            intent = intents.get(transaction)
+            state = intent and stripe_status_to_state(intent.status)
+            if state == "done":
+                to_done |= transaction
+            elif state == "authorized":
+                to_authorized |= transaction
+            elif state == "cancel":
+                to_cancel |= transaction
+            elif (
+                intent
+                and intent.status != "processing"
+                and transaction.create_date < abandon_before
+            ):
+                to_abandon |= transaction
+        if to_abandon:
+            intents = to_abandon._invader_call_stripe_intents(
+                "cancel_payment_intent", max_workers
+            )
+            to_cancel |= transaction_obj.browse(
+                [
+                    transaction.id
+                    for transaction, intent in intents.items()
+                    if intent.status == "canceled"
+                ]
+            )
+        to_done._set_transaction_done()
+        to_authorized._set_transaction_authorized()
+        to_cancel._set_transaction_cancel()
+        return to_done | to_authorized | to_cancel
+
+    @api.model
+    def _cron_reconcile_stripe_transactions(
+        self,
+        chunk_size=100,
+        max_workers=8,
+        min_age_minutes=15,
+        abandon_hours=24,
+    ):
+        """
+        Reconcile the pending Stripe transactions with their intents
+
+        The pending transactions not checked yet by the run are processed by
+        chunks, their check time being written at the end of each chunk.
+        Transactions younger than min_age_minutes are left to the customer
+        (3DS in progress...); the ones still pending after abandon_hours
+        are canceled, on Stripe first (see
+        ``_invader_reconcile_stripe_intents``).
+        """
+        now = fields.Datetime.now()
+        min_create_date = now - timedelta(minutes=min_age_minutes)
+        abandon_before = now - timedelta(hours=abandon_hours)
+        domain = [
+            ("state", "=", "pending"),
+            ("acquirer_reference", "!=", False),
+            (
+                "acquirer_id",
+                "in",
+                self.env[
+                    "payment.acquirer"
+                ]._invader_get_provider_acquirer_ids("stripe"),
+            ),
+            ("create_date", "<", min_create_date),
+            "|",
+            ("invader_stripe_last_check", "=", False),
+            ("invader_stripe_last_check", "<", now),
+        ]
+        while True:
+            transactions = self.search(domain, order="id", limit=chunk_size)
+            if not transactions:
+                break
+            transactions._invader_reconcile_stripe_intents(
+                abandon_before, max_workers
+            )
+            transactions.write({"invader_stripe_last_check": now})
+            if not getattr(threading.current_thread(), "testing", False):
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+
+    def action_invader_stripe_request_capture(self):
+        """
+        Request the capture of the authorized Stripe transactions, done by
+        batch by the capture job (e.g. when the orders are shipped)
+        """
+        self.filtered(
+            lambda t: t.state == "authorized"
+            and t.acquirer_id.provider == "stripe"
+        ).write({"invader_stripe_capture_requested": True})
+
+    def stripe_s2s_capture_transaction(self, **kwargs):
+        # called by the *Capture Transaction* button (action_capture)
+        self.action_invader_stripe_request_capture()
+
+    @api.model
+    def _cron_capture_stripe_transactions(self, chunk_size=100, max_workers=8):
+        """
+        Capture the Stripe transactions of which the capture is requested,
+        by chunks. The captured transactions are set done by batch; the
+        failed captures are retried by the next run.
+        """
+        domain = [
+            ("state", "=", "authorized"),
+            ("invader_stripe_capture_requested", "=", True),
+            (
+                "acquirer_id",
+                "in",
+                self.env[
+                    "payment.acquirer"
+                ]._invader_get_provider_acquirer_ids("stripe"),
+            ),
+        ]
+        last_id = 0
+        while True:
+            transactions = self.search(
+                domain + [("id", ">", last_id)], order="id", limit=chunk_size
+            )
+            if not transactions:
+                break
+            intents = transactions._invader_call_stripe_intents(
+                "capture_payment_intent", max_workers
+            )
+            captured = self.browse(
+                [
+                    transaction.id
+                    for transaction, intent in intents.items()
+                    if intent.status == "succeeded"
+                ]
+            )
+            captured.with_context(
+                invader_payment_batch_notify=True
+            )._set_transaction_done()
+            captured.write({"invader_stripe_capture_requested": False})
+            last_id = transactions[-1].id
+            if not getattr(threading.current_thread(), "testing", False):
+                self.env.cr.commit()  # pylint: disable=invalid-commit
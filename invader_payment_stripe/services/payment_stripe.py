@@ -2,17 +2,23 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
 import logging
+import time
 
 import stripe
 from cerberus import Validator
 
-from odoo import _
+from odoo import _, registry
 from odoo.tools.float_utils import float_round
 
 from odoo.addons.base_rest.components.service import to_int
 from odoo.addons.component.core import AbstractComponent
+from odoo.addons.invader_payment import metrics
+from odoo.addons.invader_payment.exceptions import NotReplayableResponse
 from odoo.addons.payment_stripe.models.payment import INT_CURRENCIES
 
+from ..circuit_breaker import get_breaker
+from ..stripe_client import get_client
+
 _logger = logging.getLogger(__name__)
 
 # map Stripe transaction statuses to Odoo payment.transaction statuses
@@ -21,11 +27,31 @@ STRIPE_TRANSACTION_STATUSES = {
     "processing": "pending",
     "requires_action": "pending",
     "requiresauthorization": "pending",
-    "requirescapture": "pending",
+    "requirescapture": "authorized",
     "requiresconfirmation": "pending",
     "requirespaymentmethod": "pending",
     "succeeded": "done",
 }
+# failures of the transport (timeout, Stripe unavailable...): the outcome
+# of the Stripe call is unknown
+STRIPE_TRANSPORT_ERRORS = (
+    stripe.error.APIConnectionError,
+    stripe.error.APIError,
+    stripe.error.RateLimitError,
+)
+# statuses of the intents paid (or being paid), not canceled when their
+# transaction is replaced
+STRIPE_PAID_STATUSES = ("processing", "requires_capture", "succeeded")
+
+
+def stripe_status_to_state(status):
+    """
+    Return the payment.transaction state of a Stripe intent status
+    ('requires_capture' and 'requirescapture' are both accepted)
+    """
+    return STRIPE_TRANSACTION_STATUSES.get(
+        status
+    ) or STRIPE_TRANSACTION_STATUSES.get(status.replace("_", ""))
 
 
 class PaymentServiceStripe(AbstractComponent):
@@ -34,11 +60,49 @@ class PaymentServiceStripe(AbstractComponent):
     _inherit = "base.rest.service"
     _usage = "payment_stripe"
     _description = "REST Services for Stripe payments"
+    _invader_static_validators = (
+        "_validator_prepare_intent",
+        "_validator_return_prepare_intent",
+        "_validator_confirm_payment",
+        "_validator_return_confirm_payment",
+    )
 
     @property
     def payment_service(self):
         return self.component(usage="invader.payment")
 
+    def _validator_prepare_intent(self):
+        """
+        Validator of prepare_intent service
+        target: see _allowed_payment_target()
+        payment_mode_id: The payment mode used to pay
+        :return: dict
+        """
+        res = self.payment_service._invader_get_target_validator()
+        res.update(
+            {
+                "payment_mode_id": {
+                    "coerce": to_int,
+                    "type": "integer",
+                    "required": True,
+                }
+            }
+        )
+        res.update(
+            self.payment_service._invader_get_idempotency_key_validator()
+        )
+        return res
+
+    def _validator_return_prepare_intent(self):
+        return Validator(
+            {
+                "payment_intent_id": {"type": "string"},
+                "payment_intent_client_secret": {"type": "string"},
+                "error": {"type": "string"},
+            },
+            allow_unknown=True,
+        )
+
     def _validator_confirm_payment(self):
         """
         Validator of confirm_payment service
@@ -60,6 +124,9 @@ class PaymentServiceStripe(AbstractComponent):
                 "stripe_payment_method_id": {"type": "string"},
             }
         )
+        res.update(
+            self.payment_service._invader_get_idempotency_key_validator()
+        )
         return res
 
     def _validator_return_confirm_payment(self):
@@ -92,14 +159,9 @@ class PaymentServiceStripe(AbstractComponent):
         :param intent: string
         :return: payment.transaction
         """
-        transaction = self.env["payment.transaction"].search(
-            [
-                ("acquirer_reference", "=", intent),
-                ("acquirer_id.provider", "=", "stripe"),
-            ],
-            limit=1,
-        )
-        return transaction
+        return self.env[
+            "payment.transaction"
+        ]._invader_get_stripe_transaction_from_intent(intent)
 
     def _get_stripe_private_key(self, transaction):
         """
@@ -107,11 +169,105 @@ class PaymentServiceStripe(AbstractComponent):
         :param transaction: payment.transaction
         :return: string
         """
+        config = transaction.acquirer_id._invader_get_config()
+        if config["provider"] != "stripe":
+            return False
+        return config["stripe_secret_key"]
+
+    def _get_stripe_client(self, transaction, read_only=False):
+        """
+        Return the pooled Stripe client of the transaction acquirer
+        :param transaction: payment.transaction
+        :param read_only: True for the calls only reading an intent, of
+                          which the timeout is bounded by the latency
+                          budget. The calls creating or confirming an
+                          intent are not: the outcome of a call timing out
+                          on the client side is unknown.
+        :return: StripeClient
+        """
+        config = transaction.acquirer_id._invader_get_config()
+        timeout = config.get("stripe_timeout")
+        latency_budget = config.get("stripe_latency_budget")
+        if read_only and latency_budget:
+            # a slower call is a failure of the circuit breaker anyway: do
+            # not keep the worker waiting for it
+            timeout = min(timeout, latency_budget)
+        return get_client(
+            self._get_stripe_private_key(transaction),
+            timeout=timeout,
+            pool_size=config.get("stripe_pool_size"),
+            api_base=config.get("stripe_api_base"),
+        )
+
+    def prepare_intent(self, target, **params):
+        """
+        This is the rest service exposed to locomotive and called when the
+        payment step is shown.
+        The transaction and the intent are created, the intent being then
+        confirmed by the client, directly with Stripe, with the returned
+        client secret. confirm_payment is then called with the
+        stripe_payment_intent_id to get the outcome.
+        :param target: string (authorized value is checked by service)
+        :param payment_mode_id: string (The Odoo payment mode id)
+        :param idempotency_key: optional, see _invader_idempotent_call
+        :return:
+        """
+        return self.payment_service._invader_idempotent_call(
+            "payment_stripe.prepare_intent",
+            dict(params, target=target),
+            lambda: self._prepare_intent(target, **params),
+        )
 
-        acquirer = transaction.acquirer_id
-        return acquirer.filtered(
-            lambda a: a.provider == "stripe"
-        ).stripe_secret_key
+    def _prepare_intent(self, target, **params):
+        cr = self.env.cr
+        with metrics.span("payment_stripe.payable_resolution", cr):
+            payable = self.payment_service._invader_find_payable_from_target(
+                target, **params
+            )
+        acquirer = self.env["payment.acquirer"].browse(
+            params.get("payment_mode_id")
+        )
+        with metrics.span("payment_stripe.provider_check", cr):
+            self.payment_service._check_provider(acquirer, "stripe")
+        if not self._get_stripe_breaker(acquirer).allow_request():
+            _logger.warning("Stripe circuit open for acquirer %s", acquirer.id)
+            metrics.increment("payment_stripe.circuit_open")
+            # not replayed: the retry must call Stripe once it is back
+            raise NotReplayableResponse({"error": _("Payment Error")})
+        with metrics.span("payment_stripe.transaction_create", cr):
+            values = payable._invader_prepare_payment_transaction_data(
+                acquirer
+            )
+            # the transaction of a previous display of the payment step
+            transaction = self._get_stripe_draft_transaction(
+                payable,
+                acquirer,
+                values,
+                lambda t: t.invader_stripe_client_confirm,
+            )
+            if transaction and transaction.state != "draft":
+                # paid by the client for the previous amount
+                return self._generate_stripe_mismatch_response()
+            if not transaction:
+                transaction = self.env["payment.transaction"].create(
+                    dict(values, invader_stripe_client_confirm=True)
+                )
+        try:
+            intent = self._prepare_stripe_intent(transaction)
+        except Exception as e:
+            _logger.error("Error preparing stripe intent", exc_info=True)
+            metrics.increment("payment_stripe.error")
+            self._apply_stripe_intent(transaction, None, e)
+            return self._check_stripe_error_replayable(
+                e, {"error": _("Payment Error")}
+            )
+        # the transaction stays draft until confirm_payment
+        if transaction.acquirer_reference != intent.id:
+            transaction.write({"acquirer_reference": intent.id})
+        return {
+            "payment_intent_id": intent.id,
+            "payment_intent_client_secret": intent.client_secret,
+        }
 
     def confirm_payment(self, target, **params):
         """
@@ -126,31 +282,60 @@ class PaymentServiceStripe(AbstractComponent):
             * The intent state is 'requires_action'
             * The stripe_payment_intent_id is passed
             * The intent state is 'succeeded'
+        * Confirmed by the client (see prepare_intent):
+            * The stripe_payment_intent_id is passed
+            * The intent is only retrieved, to update the transaction
         :param target: string (authorized value is checked by service)
         :param payment_mode_id: string (The Odoo payment mode id)
         :param stripe_payment_method_id:
         :param stripe_payment_intent_id:
+        :param idempotency_key: optional, see _invader_idempotent_call
         :return:
         """
+        return self.payment_service._invader_idempotent_call(
+            "payment_stripe.confirm_payment",
+            dict(params, target=target),
+            lambda: self._confirm_payment(target, **params),
+        )
+
+    def _confirm_payment(self, target, **params):
         payment_mode_id = params.get("payment_mode_id")
         stripe_payment_method_id = params.get("stripe_payment_method_id")
         stripe_payment_intent_id = params.get("stripe_payment_intent_id")
-        transaction_obj = self.env["payment.transaction"]
-        payable = self.payment_service._invader_find_payable_from_target(
-            target, **params
-        )
+        cr = self.env.cr
+        with metrics.span("payment_stripe.payable_resolution", cr):
+            payable = self.payment_service._invader_find_payable_from_target(
+                target, **params
+            )
 
         # Stripe part
         transaction = None
         acquirer = self.env["payment.acquirer"].browse(payment_mode_id)
-        self.payment_service._check_provider(acquirer, "stripe")
+        with metrics.span("payment_stripe.provider_check", cr):
+            self.payment_service._check_provider(acquirer, "stripe")
+        if not self._get_stripe_breaker(acquirer).allow_request():
+            # fail fast, Stripe is failing or too slow (not replayed: the
+            # retry must call Stripe once it is back)
+            _logger.warning("Stripe circuit open for acquirer %s", acquirer.id)
+            metrics.increment("payment_stripe.circuit_open")
+            raise NotReplayableResponse(
+                self._generate_stripe_error_response(target, **params)
+            )
+        if acquirer._invader_get_config()["stripe_two_phase_confirm"]:
+            return self._confirm_payment_two_phase(
+                payable, acquirer, target, **params
+            )
 
         try:
             if stripe_payment_method_id:
                 # First step
-                transaction = transaction_obj.create(
-                    payable._invader_prepare_payment_transaction_data(acquirer)
-                )
+                with metrics.span("payment_stripe.transaction_create", cr):
+                    transaction = self._get_stripe_payment_transaction(
+                        payable, acquirer, stripe_payment_method_id
+                    )
+                if transaction.state != "draft":
+                    # paid by a previous attempt, for another amount
+                    return self._generate_stripe_mismatch_response()
                 intent = self._prepare_stripe_intent(
                     transaction, stripe_payment_method_id
                 )
@@ -163,59 +348,473 @@ class PaymentServiceStripe(AbstractComponent):
                 intent = self._confirm_stripe_intent(
                     transaction, stripe_payment_intent_id
                 )
+                if not self._check_stripe_intent_amount(
+                    transaction, intent, payable
+                ):
+                    intent = self._cancel_stripe_intent(transaction, intent)
+                    self._apply_unmatched_stripe_intent(transaction, intent)
+                    return self._generate_stripe_mismatch_response()
             if intent.status == "succeeded":
                 # Handle post-payment fulfillment
                 transaction._set_transaction_done()
+            elif intent.status == "requires_capture":
+                # Authorized, captured later by the capture job
+                transaction._set_transaction_authorized()
             else:
                 transaction.write(
-                    {"state": STRIPE_TRANSACTION_STATUSES[intent.status]}
+                    {"state": stripe_status_to_state(intent.status)}
+                )
+            with metrics.span("payment_stripe.response_building", cr):
+                return self._generate_stripe_response(
+                    intent, payable, target, **params
                 )
-            return self._generate_stripe_response(
-                intent, payable, target, **params
-            )
 
+        except NotReplayableResponse:
+            raise
         except Exception as e:
             _logger.error("Error confirming stripe payment", exc_info=True)
+            metrics.increment("payment_stripe.error")
             if transaction:
-                # Odoo does not like to change not draft transaction to error
-                transaction.write({"state": "draft"})
-                transaction._set_transaction_error(
-                    _("Exception: {}".format(e))
-                )
+                self._apply_stripe_intent(transaction, None, e)
+            return self._check_stripe_error_replayable(
+                e, self._generate_stripe_error_response(target, **params)
+            )
+
+    def _confirm_payment_two_phase(self, payable, acquirer, target, **params):
+        """
+        confirm_payment without database locks during the Stripe call.
+        The transaction is handled on a cursor of its own: the draft
+        transaction is committed, Stripe is called, then the result is
+        applied in a second database transaction, retried on concurrency
+        errors. The cursor of the request (holding the idempotency key) is
+        left untouched, and does not see these changes.
+        """
+        stripe_payment_method_id = params.get("stripe_payment_method_id")
+        stripe_payment_intent_id = params.get("stripe_payment_intent_id")
+        if not stripe_payment_method_id and not stripe_payment_intent_id:
             return self._generate_stripe_error_response(target, **params)
+        with registry(self.env.cr.dbname).cursor() as cr:
+            env = self.env(cr=cr)
+            if stripe_payment_method_id:
+                with metrics.span("payment_stripe.transaction_create", cr):
+                    transaction = self._get_stripe_payment_transaction(
+                        payable.with_env(env),
+                        acquirer.with_env(env),
+                        stripe_payment_method_id,
+                    )
+                if transaction.state != "draft":
+                    # paid by a previous attempt, for another amount
+                    return self._generate_stripe_mismatch_response()
+            else:
+                transaction = env[
+                    "payment.transaction"
+                ]._invader_get_stripe_transaction_from_intent(
+                    stripe_payment_intent_id
+                )
+            # not the cursor of the request
+            cr.commit()  # pylint: disable=invalid-commit
+
+            intent = error = None
+            matched = True
+            try:
+                if stripe_payment_method_id:
+                    intent = self._prepare_stripe_intent(
+                        transaction, stripe_payment_method_id
+                    )
+                else:
+                    intent = self._confirm_stripe_intent(
+                        transaction, stripe_payment_intent_id
+                    )
+                    matched = self._check_stripe_intent_amount(
+                        transaction, intent, payable
+                    )
+                    if not matched:
+                        intent = self._cancel_stripe_intent(
+                            transaction, intent
+                        )
+            except Exception as e:
+                _logger.error("Error confirming stripe payment", exc_info=True)
+                metrics.increment("payment_stripe.error")
+                error = e
+
+            self.payment_service._invader_retry_on_concurrency_failure(
+                lambda: self._apply_stripe_intent(transaction, intent, error)
+                if matched or error
+                else self._apply_unmatched_stripe_intent(transaction, intent),
+                env=env,
+            )
+        if not matched and not error:
+            return self._generate_stripe_mismatch_response()
+        if error:
+            return self._check_stripe_error_replayable(
+                error, self._generate_stripe_error_response(target, **params)
+            )
+        with metrics.span("payment_stripe.response_building", self.env.cr):
+            return self._generate_stripe_response(
+                intent, payable, target, **params
+            )
+
+    def _get_stripe_draft_transaction(
+        self, payable, acquirer, values, predicate
+    ):
+        """
+        Return the last draft transaction of the payable left by a previous
+        call (timeout, new display of the payment step...) and matching
+        predicate, if it is still for the amount to pay.
+        Otherwise, its intent is fetched from Stripe (see
+        ``_replace_stripe_transaction``): the transaction is canceled and an
+        empty recordset is returned, unless its intent is already paid. The
+        transaction is then returned with the state of its intent, to
+        refuse a second payment.
+        :param payable: invader.payable record
+        :param acquirer: payment.acquirer
+        :param values: the values of a new transaction of the payable
+        :param predicate: callable taking a payment.transaction
+        :return: payment.transaction
+        """
+        transaction = (
+            payable._invader_get_transactions()
+            .filtered(
+                lambda t: t.state == "draft"
+                and t.acquirer_id == acquirer
+                and predicate(t)
+            )
+            .sorted("id")[-1:]
+        )
+        if not transaction:
+            return transaction
+        currency = transaction.currency_id
+        if currency.id == values["currency_id"] and not (
+            currency.compare_amounts(transaction.amount, values["amount"])
+        ):
+            _logger.info(
+                "Reusing the draft Stripe transaction %s",
+                transaction.reference,
+            )
+            return transaction
+        _logger.info(
+            "Replacing the draft Stripe transaction %s, the amount to pay "
+            "changed",
+            transaction.reference,
+        )
+        if self._replace_stripe_transaction(transaction):
+            return transaction.browse()
+        return transaction
+
+    def _replace_stripe_transaction(self, transaction):
+        """
+        Release the draft transaction left by a previous call, for another
+        amount. Its intent is fetched from Stripe: retrieved, or created
+        again with the idempotency key of the first attempt (Stripe then
+        returns the intent of the first attempt). The intent is canceled on
+        Stripe, then the transaction, unless the intent is already paid (or
+        being paid): its outcome is then applied to the transaction, which
+        is flagged to review.
+        On a Stripe failure, the transaction is kept, to be released by the
+        next attempt.
+        :param transaction: payment.transaction
+        :return: True if the transaction is canceled
+        """
+        try:
+            intent = self._prepare_stripe_intent(
+                transaction, transaction.invader_stripe_payment_method or None
+            )
+            intent = self._cancel_stripe_intent(transaction, intent)
+        except Exception:
+            _logger.error(
+                "Error releasing the Stripe transaction %s",
+                transaction.reference,
+                exc_info=True,
+            )
+            metrics.increment("payment_stripe.error")
+            # not replayed: the retry must release the transaction
+            raise NotReplayableResponse({"error": _("Payment Error")})
+        return self._apply_unmatched_stripe_intent(transaction, intent)
+
+    def _apply_unmatched_stripe_intent(self, transaction, intent):
+        """
+        Update the transaction from its intent not paying the amount to pay
+        (any longer), once canceled on Stripe if it could be (see
+        ``_cancel_stripe_intent``): the transaction is canceled with the
+        intent, or takes the outcome of the paid intent and is flagged to
+        review.
+        :param transaction: payment.transaction
+        :param intent: StripeIntent
+        :return: True if the transaction is canceled
+        """
+        self._apply_stripe_intent(transaction, intent)
+        if transaction.state == "cancel":
+            return True
+        transaction._invader_stripe_flag_to_review(
+            _("Paid on Stripe, but not for the amount to pay.")
+        )
+        return False
+
+    def _cancel_stripe_intent(self, transaction, intent):
+        """
+        Cancel the intent on Stripe, so it can no longer be paid (e.g. by
+        the client holding its client secret), unless it is already paid
+        (or being paid) or canceled
+        :param transaction: payment.transaction
+        :param intent: StripeIntent
+        :return: StripeIntent
+        """
+        if intent.status in STRIPE_PAID_STATUSES + ("canceled",):
+            return intent
+        client = self._get_stripe_client(transaction)
+        idempotency_key = self._get_stripe_idempotency_key(
+            transaction, "cancel", intent.id
+        )
+        return self._call_stripe(
+            transaction,
+            "cancel",
+            lambda: client.cancel_payment_intent(
+                intent.id, idempotency_key=idempotency_key
+            ),
+        )
+
+    def _check_stripe_intent_amount(self, transaction, intent, payable):
+        """
+        Check that the intent confirmed by the client pays the current
+        amount of the payable (it may have changed since prepare_intent)
+        :param transaction: payment.transaction
+        :param intent: StripeIntent
+        :param payable: invader.payable record
+        :return: True if it pays it
+        """
+        if not transaction.invader_stripe_client_confirm:
+            return True
+        values = payable._invader_prepare_payment_transaction_data(
+            transaction.acquirer_id
+        )
+        currency = self.env["res.currency"].browse(values["currency_id"])
+        if (intent.currency or "").lower() != currency.name.lower() or (
+            intent.amount
+            != self._get_formatted_amount(currency, values["amount"])
+        ):
+            _logger.error(
+                "Stripe intent %s of %s %s does not pay the %s %s of %s",
+                intent.id,
+                intent.amount,
+                intent.currency,
+                values["amount"],
+                currency.name,
+                transaction.reference,
+            )
+            return False
+        return True
+
+    def _get_stripe_payment_transaction(
+        self, payable, acquirer, stripe_payment_method_id
+    ):
+        """
+        Return the draft transaction of the payable left by a previous
+        attempt with the same payment method (timeout, recycled worker...),
+        or a new one. Its intent is then created again with the same
+        idempotency key, so Stripe returns the intent of the first attempt
+        instead of creating (and charging) a second one.
+        The draft transaction is only reused for the same amount and
+        currency (see ``_get_stripe_draft_transaction``).
+        :param payable: invader.payable record
+        :param acquirer: payment.acquirer
+        :param stripe_payment_method_id: string
+        :return: payment.transaction
+        """
+        values = payable._invader_prepare_payment_transaction_data(acquirer)
+        transaction = self._get_stripe_draft_transaction(
+            payable,
+            acquirer,
+            values,
+            lambda t: t.invader_stripe_payment_method
+            == stripe_payment_method_id,
+        )
+        if transaction:
+            return transaction
+        return payable.env["payment.transaction"].create(
+            dict(
+                values, invader_stripe_payment_method=stripe_payment_method_id
+            )
+        )
+
+    def _get_stripe_idempotency_key(self, transaction, call, *args):
+        """
+        Return the idempotency key of a Stripe call, derived from the
+        transaction reference: a repeated call returns the result of the
+        first one instead of being done again.
+        :param transaction: payment.transaction
+        :param call: string, e.g. 'create'
+        :param args: strings, distinguishing the calls of the transaction
+        :return: string
+        """
+        return ":".join(("invader", call, transaction.reference) + args)
 
-    def _prepare_stripe_intent(self, transaction, stripe_payment_method_id):
+    def _apply_stripe_intent(self, transaction, intent, error=None):
+        """
+        Update the transaction from the intent returned by Stripe
+        :param transaction: payment.transaction
+        :param intent: StripeIntent (None on error)
+        :param error: the exception raised by the Stripe call
+        """
+        if error and isinstance(error, STRIPE_TRANSPORT_ERRORS):
+            # the outcome is unknown: the transaction is kept, to be
+            # retried with the same idempotency keys
+            _logger.warning(
+                "Stripe transaction %s kept %s after the failure: %s",
+                transaction.reference,
+                transaction.state,
+                error,
+            )
+            return
+        if error or not intent:
+            # Odoo does not like to change not draft transaction to error
+            transaction.write({"state": "draft"})
+            transaction._set_transaction_error(
+                _("Exception: {}".format(error))
+            )
+            return
+        if transaction.acquirer_reference != intent.id:
+            transaction.write({"acquirer_reference": intent.id})
+        if intent.status == "succeeded":
+            transaction._set_transaction_done()
+        elif intent.status == "requires_capture":
+            transaction._set_transaction_authorized()
+        elif intent.status == "canceled":
+            transaction._set_transaction_cancel()
+        else:
+            transaction.write({"state": stripe_status_to_state(intent.status)})
+
+    def _prepare_stripe_intent(
+        self, transaction, stripe_payment_method_id=None
+    ):
         """
         Prepare a StripeIntent with payment.transaction data
+        Without payment method, the intent is to be confirmed by the client.
+        The intent already attached to the transaction is returned instead
+        of creating a new one.
         :param tx_data:
         :param stripe_payment_method_id:
         :return: StripeIntent
         """
+        if transaction.acquirer_reference:
+            client = self._get_stripe_client(transaction, read_only=True)
+            return self._call_stripe(
+                transaction,
+                "retrieve",
+                lambda: client.retrieve_payment_intent(
+                    transaction.acquirer_reference
+                ),
+            )
         metadata = {"reference": transaction.reference}
         currency = transaction.currency_id
-        intent = stripe.PaymentIntent.create(
-            payment_method=stripe_payment_method_id,
-            amount=self._get_formatted_amount(currency, transaction.amount),
-            currency=currency.name,
-            confirmation_method="manual",
-            confirm=True,
-            description=transaction.reference,
-            metadata=metadata,
-            api_key=self._get_stripe_private_key(transaction),
-        )
-        return intent
+        amount = self._get_formatted_amount(currency, transaction.amount)
+        capture_method = transaction.acquirer_id._invader_get_config()[
+            "stripe_capture_method"
+        ]
+        if stripe_payment_method_id:
+            confirm_params = {
+                "payment_method": stripe_payment_method_id,
+                "confirmation_method": "manual",
+                "confirm": True,
+            }
+        else:
+            confirm_params = {"confirmation_method": "automatic"}
+        idempotency_key = self._get_stripe_idempotency_key(
+            transaction, "create", stripe_payment_method_id or "client"
+        )
+        client = self._get_stripe_client(transaction)
+        return self._call_stripe(
+            transaction,
+            "create",
+            lambda: client.create_payment_intent(
+                idempotency_key=idempotency_key,
+                amount=amount,
+                currency=currency.name,
+                capture_method=capture_method,
+                description=transaction.reference,
+                metadata=metadata,
+                **confirm_params
+            ),
+        )
 
     def _confirm_stripe_intent(self, transaction, stripe_payment_intent_id):
         """
         Confirm the Stripe Intent and return it
+        (only retrieved when confirmed by the client)
         :param stripe_payment_intent_id:
         :return: StripeIntent
         """
-        return stripe.PaymentIntent.confirm(
-            stripe_payment_intent_id,
-            api_key=self._get_stripe_private_key(transaction),
+        if transaction.invader_stripe_client_confirm:
+            client = self._get_stripe_client(transaction, read_only=True)
+            return self._call_stripe(
+                transaction,
+                "retrieve",
+                lambda: client.retrieve_payment_intent(
+                    stripe_payment_intent_id
+                ),
+            )
+        client = self._get_stripe_client(transaction)
+        idempotency_key = self._get_stripe_idempotency_key(
+            transaction, "confirm", stripe_payment_intent_id
+        )
+        return self._call_stripe(
+            transaction,
+            "confirm",
+            lambda: client.confirm_payment_intent(
+                stripe_payment_intent_id, idempotency_key=idempotency_key
+            ),
+        )
+
+    def _get_stripe_breaker(self, acquirer):
+        """
+        Return the circuit breaker of the Stripe calls of the acquirer
+        :param acquirer: payment.acquirer
+        :return: CircuitBreaker
+        """
+        config = acquirer._invader_get_config()
+        return get_breaker(
+            (self.env.cr.dbname, acquirer.id),
+            failure_threshold=config.get("stripe_breaker_threshold", 0),
+            reset_timeout=config.get("stripe_breaker_reset_timeout", 0),
+            latency_budget=config.get("stripe_latency_budget", 0),
         )
 
+    def _call_stripe(self, transaction, call, func):
+        """
+        Call Stripe (func), recording the outcome in the circuit breaker
+        of the transaction acquirer. Card errors are not Stripe failures.
+        :param call: name of the call, for the metrics
+        :param func: callable without argument
+        """
+        breaker = self._get_stripe_breaker(transaction.acquirer_id)
+        start = time.perf_counter()
+        try:
+            with metrics.span(
+                "payment_stripe.provider_call", self.env.cr, call=call
+            ):
+                res = func()
+        except stripe.error.CardError:
+            breaker.record_success()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success(time.perf_counter() - start)
+        return res
+
+    def _check_stripe_error_replayable(self, error, response):
+        """
+        Return the error response of a failed Stripe call, raising it as
+        NotReplayableResponse on a transport failure (timeout, Stripe
+        unavailable...): the retry of the request must call Stripe again
+        instead of replaying the failure.
+        :param error: the exception raised by the Stripe call
+        :param response: dict
+        :return: dict
+        """
+        if isinstance(error, STRIPE_TRANSPORT_ERRORS):
+            raise NotReplayableResponse(response)
+        return response
+
     def _generate_stripe_response(self, intent, payable, target, **params):
         """
         This is the message returned to client
@@ -233,8 +832,9 @@ class PaymentServiceStripe(AbstractComponent):
                     "requires_action": True,
                     "payment_intent_client_secret": intent.client_secret,
                 }
-            elif intent.status == "succeeded":
-                # The payment didn’t need any additional actions and completed!
+            elif intent.status in ("succeeded", "requires_capture"):
+                # The payment didn’t need any additional actions and completed
+                # (or is authorized, to be captured later)!
                 return {"success": True}
             elif intent.status == "canceled":
                 return {"error": _("Payment canceled.")}
@@ -244,3 +844,10 @@ class PaymentServiceStripe(AbstractComponent):
 
     def _generate_stripe_error_response(self, target, **params):
         return self._generate_stripe_response(None, None, target, **params)
+
+    def _generate_stripe_mismatch_response(self):
+        """
+        The message returned to the client when the payment does not match
+        the amount to pay (see ``_apply_unmatched_stripe_intent``)
+        """
+        return {"error": _("The payment does not match the amount to pay.")}
@@ -0,0 +1,124 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Pooled clients of the Stripe API
+
+The Stripe SDK sends the requests of ``stripe.PaymentIntent.create(...,
+api_key=...)`` through a global http client. The clients of this module
+keep their own ``requests`` session, so the connections (and their TLS
+handshake) are reused by the next calls of the worker.
+
+Clients are created once per worker and configuration (api key, timeout,
+pool size, api base)::
+
+    client = get_client(api_key, timeout=30, pool_size=10)
+    intent = client.create_payment_intent(amount=100, currency="eur")
+
+The requests are sent through the requestor of the SDK
+(``stripe.api_requestor``, ``stripe.util``), not part of its public API:
+``stripe`` is pinned below 8, which reorganized these modules.
+"""
+import threading
+from urllib.parse import quote_plus
+
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_POOL_SIZE = 10
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class StripeClient(object):
+    def __init__(
+        self,
+        api_key,
+        timeout=DEFAULT_TIMEOUT,
+        pool_size=DEFAULT_POOL_SIZE,
+        api_base=None,
+    ):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.http_client = stripe.http_client.RequestsClient(
+            timeout=timeout, session=self.session
+        )
+
+    def request(self, method, url, params=None, idempotency_key=None):
+        """Send a request to the Stripe API and return the StripeObject"""
+        requestor = stripe.api_requestor.APIRequestor(
+            key=self.api_key, client=self.http_client, api_base=self.api_base
+        )
+        response, api_key = requestor.request(
+            method, url, params, stripe.util.populate_headers(idempotency_key)
+        )
+        return stripe.util.convert_to_stripe_object(response, api_key)
+
+    def _payment_intent_url(self, intent_id, action=None):
+        url = "{}/{}".format(
+            stripe.PaymentIntent.class_url(), quote_plus(intent_id)
+        )
+        if action:
+            url = "{}/{}".format(url, action)
+        return url
+
+    def create_payment_intent(self, idempotency_key=None, **params):
+        return self.request(
+            "post",
+            stripe.PaymentIntent.class_url(),
+            params,
+            idempotency_key=idempotency_key,
+        )
+
+    def retrieve_payment_intent(self, intent_id, **params):
+        return self.request("get", self._payment_intent_url(intent_id), params)
+
+    def confirm_payment_intent(
+        self, intent_id, idempotency_key=None, **params
+    ):
+        return self.request(
+            "post",
+            self._payment_intent_url(intent_id, "confirm"),
+            params,
+            idempotency_key=idempotency_key,
+        )
+
+    def cancel_payment_intent(self, intent_id, idempotency_key=None, **params):
+        return self.request(
+            "post",
+            self._payment_intent_url(intent_id, "cancel"),
+            params,
+            idempotency_key=idempotency_key,
+        )
+
+    def capture_payment_intent(
+        self, intent_id, idempotency_key=None, **params
+    ):
+        return self.request(
+            "post",
+            self._payment_intent_url(intent_id, "capture"),
+            params,
+            idempotency_key=idempotency_key,
+        )
+
+
+def get_client(
+    api_key,
+    timeout=DEFAULT_TIMEOUT,
+    pool_size=DEFAULT_POOL_SIZE,
+    api_base=None,
+):
+    """Return the client of the worker for this configuration"""
+    key = (api_key, timeout, pool_size, api_base)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = StripeClient(*key)
+    return client
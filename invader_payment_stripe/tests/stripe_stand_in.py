@@ -0,0 +1,270 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Local stand-in of the Stripe API, for tests and load tests
+
+It implements the PaymentIntent calls of ``invader_payment_stripe``
+(create, retrieve, confirm, capture, cancel) with a configurable latency,
+error rate and rate of intents requiring an action (3DS).
+
+From a test::
+
+    with StripeStandIn(latency=0.05, requires_action_rate=0.1) as server:
+        acquirer.stripe_api_base = server.api_base
+        ...
+
+Standalone, to load test a running Odoo (set the *Stripe API Base* of the
+acquirer to the printed url)::
+
+    python stripe_stand_in.py --port 12111 --latency 0.3 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qsl, urlparse
+
+INTENT_PATH = re.compile(
+    r"^/v1/payment_intents(?:/(?P<id>[^/]+))?(?:/(?P<action>[a-z_]+))?$"
+)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StripeStandInHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # keep the test logs quiet
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Request-Id", "req_{}".format(uuid.uuid4().hex))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, error_type, message):
+        self._send_json(
+            status, {"error": {"type": error_type, "message": message}}
+        )
+
+    def _read_params(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        query = urlparse(self.path).query
+        return dict(parse_qsl(body or query))
+
+    def _handle(self, method):
+        stand_in = self.server.stand_in
+        params = self._read_params()
+        if stand_in.latency:
+            time.sleep(stand_in.latency)
+        if stand_in.error_rate and random.random() < stand_in.error_rate:
+            return self._send_error(500, "api_error", "Simulated error")
+        match = INTENT_PATH.match(urlparse(self.path).path)
+        if not match:
+            return self._send_error(
+                404, "invalid_request_error", "Unrecognized request URL"
+            )
+        intent_id, action = match.group("id"), match.group("action")
+        if not intent_id:
+            if method != "POST":
+                return self._send_error(
+                    405, "invalid_request_error", "Method not allowed"
+                )
+            return self._send_json(
+                200,
+                stand_in.create_intent(
+                    params, self.headers.get("Idempotency-Key")
+                ),
+            )
+        intent = stand_in.get_intent(intent_id)
+        if intent is None:
+            return self._send_error(
+                404,
+                "invalid_request_error",
+                "No such payment_intent: '{}'".format(intent_id),
+            )
+        if method == "GET" and not action:
+            return self._send_json(200, intent)
+        if method == "POST" and action == "confirm":
+            return self._send_json(
+                200,
+                stand_in.update_intent(
+                    intent_id, stand_in.confirmed_status(intent)
+                ),
+            )
+        if method == "POST" and action == "cancel":
+            if intent["status"] in ("processing", "succeeded", "canceled"):
+                return self._send_error(
+                    400,
+                    "invalid_request_error",
+                    "You cannot cancel this PaymentIntent because it has a "
+                    "status of {}.".format(intent["status"]),
+                )
+            return self._send_json(
+                200, stand_in.update_intent(intent_id, "canceled")
+            )
+        if method == "POST" and action == "capture":
+            return self._send_json(
+                200, stand_in.update_intent(intent_id, "succeeded")
+            )
+        return self._send_error(
+            404, "invalid_request_error", "Unrecognized request URL"
+        )
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+class StripeStandIn(object):
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        error_rate=0.0,
+        requires_action_rate=0.0,
+    ):
+        """
+        :param port: 0 to pick a free port
+        :param latency: seconds added to each response
+        :param error_rate: ratio of requests answered with an error 500
+        :param requires_action_rate: ratio of confirmed intents requiring
+                                     an action (3DS)
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requires_action_rate = requires_action_rate
+        self.intents = {}
+        self.idempotent_intent_ids = {}
+        self._lock = threading.Lock()
+        self._server = _ThreadingHTTPServer((host, port), StripeStandInHandler)
+        self._server.stand_in = self
+        self._thread = None
+
+    @property
+    def api_base(self):
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    @staticmethod
+    def confirmed_status(intent):
+        if intent["capture_method"] == "manual":
+            return "requires_capture"
+        return "succeeded"
+
+    def create_intent(self, params, idempotency_key=None):
+        with self._lock:
+            if idempotency_key in self.idempotent_intent_ids:
+                # a repeated request: the first intent is returned
+                return self.intents[
+                    self.idempotent_intent_ids[idempotency_key]
+                ]
+        intent_id = "pi_{}".format(uuid.uuid4().hex[:24])
+        intent = {
+            "id": intent_id,
+            "object": "payment_intent",
+            "amount": int(params.get("amount") or 0),
+            "currency": params.get("currency"),
+            "description": params.get("description"),
+            "payment_method": params.get("payment_method"),
+            "client_secret": "{}_secret_{}".format(
+                intent_id, uuid.uuid4().hex[:16]
+            ),
+            "created": int(time.time()),
+            "metadata": {
+                key[len("metadata[") : -1]: value
+                for key, value in params.items()
+                if key.startswith("metadata[")
+            },
+            "capture_method": params.get("capture_method") or "automatic",
+            "next_action": None,
+        }
+        if not params.get("payment_method"):
+            status = "requires_payment_method"
+        elif str(params.get("confirm")).lower() != "true":
+            status = "requires_confirmation"
+        elif random.random() < self.requires_action_rate:
+            status = "requires_action"
+        else:
+            status = self.confirmed_status(intent)
+        intent["status"] = status
+        if status == "requires_action":
+            intent["next_action"] = {"type": "use_stripe_sdk"}
+        with self._lock:
+            self.intents[intent_id] = intent
+            if idempotency_key:
+                self.idempotent_intent_ids[idempotency_key] = intent_id
+        return intent
+
+    def get_intent(self, intent_id):
+        with self._lock:
+            return self.intents.get(intent_id)
+
+    def update_intent(self, intent_id, status):
+        with self._lock:
+            intent = self.intents[intent_id]
+            intent.update({"status": status, "next_action": None})
+            return intent
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--requires-action-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = StripeStandIn(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        requires_action_rate=args.requires_action_rate,
+    )
+    print("Stripe stand-in listening on {}".format(server.api_base))
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,10 +11,12 @@ setuptools.setup(
         'odoo14-addon-invader_invoice_payment',
         'odoo14-addon-invader_payment',
         'odoo14-addon-invader_payment_manual',
+        'odoo14-addon-invader_payment_sips',
         'odoo14-addon-invader_payment_stripe',
         'odoo14-addon-shopinvader_payment',
         'odoo14-addon-shopinvader_payment_condition',
         'odoo14-addon-shopinvader_payment_manual',
+        'odoo14-addon-shopinvader_payment_sips',
         'odoo14-addon-shopinvader_payment_stripe',
     ],
     classifiers=[
@@ -22,6 +22,13 @@ class SaleOrderPaymentTransactionEventListener(Component):
         if not shopinvader_backend:
             return
         sale_order.action_confirm_cart()
+        if self.env.context.get("invader_payment_deferred_event"):
+            # run out of the customer session, already invalidated by
+            # _invader_on_deferred_event
+            return
+        self._invalidate_session(sale_order)
+
+    def _invalidate_session(self, sale_order, render_last_sale=True):
         try:
             sess_cart_id = request.httprequest.environ.get("HTTP_SESS_CART_ID")
         except RuntimeError:
@@ -31,6 +38,10 @@ class SaleOrderPaymentTransactionEventListener(Component):
         if response and sess_cart_id:
             response.set_session("cart_id", 0)
             response.set_store_cache("cart", {})
+            if not render_last_sale:
+                # the cart is confirmed later on, out of the request
+                response.set_store_cache("last_sale", {"id": sale_order.id})
+                return
             # TODO we should not have to return the last_sale
             # information into the response, only the id...
             # This code is an awful hack... We should never have to call
@@ -40,7 +51,7 @@ class SaleOrderPaymentTransactionEventListener(Component):
             # once the cache is reset.
 
             invader_partner = sale_order.partner_id._get_invader_partner(
-                shopinvader_backend
+                sale_order.shopinvader_backend_id
             )
             if not invader_partner:
                 _logger.error(
@@ -59,5 +70,27 @@ class SaleOrderPaymentTransactionEventListener(Component):
 
             # end of awful code ....
 
+    def _must_confirm(self, event_name, transaction):
+        if event_name == "on_payment_transaction_authorized":
+            # only when the amount is captured later (e.g. when the order
+            # ships), otherwise the transaction is done once captured
+            config = transaction.acquirer_id._invader_get_config()
+            return config["capture_later"]
+        return event_name == "on_payment_transaction_done"
+
+    def _invader_on_deferred_event(self, event_name, sale_order, transaction):
+        # the customer session only exists in the current request: reset it
+        # now, the cart is confirmed by the deferred event
+        if sale_order.shopinvader_backend_id and self._must_confirm(
+            event_name, transaction
+        ):
+            self._invalidate_session(sale_order, render_last_sale=False)
+
     def on_payment_transaction_done(self, sale_order, transaction):
         self._confirm_and_invalidate_session(sale_order)
+
+    def on_payment_transaction_authorized(self, sale_order, transaction):
+        if self._must_confirm(
+            "on_payment_transaction_authorized", transaction
+        ):
+            self._confirm_and_invalidate_session(sale_order)
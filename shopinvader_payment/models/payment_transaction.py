@@ -13,3 +13,12 @@ class PaymentTransaction(models.Model):
         if self.sale_order_ids:
             return self.sale_order_ids
         return super(PaymentTransaction, self)._get_invader_payables()
+
+    def _get_invader_payables_map(self):
+        # sale_order_ids is read once for the whole recordset
+        with_sales = self.filtered("sale_order_ids")
+        res = super(
+            PaymentTransaction, self - with_sales
+        )._get_invader_payables_map()
+        res.update({record: record.sale_order_ids for record in with_sales})
+        return res
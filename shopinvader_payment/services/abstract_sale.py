@@ -10,12 +10,34 @@ class AbstractSaleService(AbstractComponent):
 
     _inherit = "shopinvader.abstract.sale.service"
 
+    _invader_transactions_values = None
+
+    def _to_json(self, sales, **kw):
+        """
+        Serialize the transactions of all the sales at once
+        (see _convert_one_sale)
+        """
+        payment = self.work.component(usage="invader.payment")
+        previous_values = self._invader_transactions_values
+        self._invader_transactions_values = payment._to_json_multi(sales)
+        try:
+            return super()._to_json(sales, **kw)
+        finally:
+            self._invader_transactions_values = previous_values
+
     def _convert_one_sale(self, sale):
         """
         Add Transaction informations
         :return:
         """
         values = super()._convert_one_sale(sale)
-        payment = self.work.component(usage="invader.payment")
-        values.update(payment._to_json(sale._invader_get_transactions()))
+        transactions_values = (self._invader_transactions_values or {}).get(
+            sale
+        )
+        if transactions_values is None:
+            payment = self.work.component(usage="invader.payment")
+            transactions_values = payment._to_json(
+                sale._invader_get_transactions()
+            )
+        values.update(transactions_values)
         return values
@@ -17,3 +17,20 @@ class InvaderPaymentService(Component):
         res = super()._invader_get_target_validator()
         res["target"]["allowed"].append("current_cart")
         return res
+
+    def _invader_get_idempotency_scope(self, method):
+        # bind the idempotency keys to the backend and the customer (not to
+        # the cart of the session, which changes once the cart is confirmed:
+        # the retry of a confirmation must still find the stored response).
+        # Guests have no identity but the cart of their session, kept by
+        # the client until it receives the response.
+        scope = super()._invader_get_idempotency_scope(method)
+        partner = getattr(self.work, "partner", None)
+        if partner:
+            owner = "partner-{}".format(partner.id)
+        else:
+            session = getattr(self.work, "shopinvader_session", None) or {}
+            owner = "cart-{}".format(session.get("cart_id") or 0)
+        return "{}:{},{}".format(
+            scope, self.work.shopinvader_backend.id, owner
+        )
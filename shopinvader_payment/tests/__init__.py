@@ -1 +1,2 @@
 from . import test_payment
+from . import test_benchmark
@@ -0,0 +1,74 @@
+# Copyright 2021 ACSONE SA/NV (<http://acsone.eu>)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo.tests import tagged
+
+from odoo.addons.invader_payment.tests.benchmark import BenchmarkMixin
+from odoo.addons.shopinvader.tests.test_cart import CommonConnectedCartCase
+
+from .common import CommonPaymentCase
+
+
+@tagged("-standard", "invader_benchmark")
+class ShopinvaderPaymentBenchmarkCase(
+    BenchmarkMixin, CommonPaymentCase, CommonConnectedCartCase
+):
+    @classmethod
+    def _create_acquirers(cls):
+        super()._create_acquirers()
+        acquirers = cls.acquirer_obj.create(
+            [
+                {
+                    "name": "Benchmark Acquirer {}".format(i),
+                    "provider": "manual",
+                }
+                for i in range(cls.benchmark_acquirers)
+            ]
+        )
+        cls.backend.write(
+            {
+                "payment_method_ids": [
+                    (0, 0, {"acquirer_id": acquirer.id})
+                    for acquirer in acquirers
+                ]
+            }
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.carts = self._benchmark_copy_carts()
+
+    def _create_transactions(self):
+        acquirers = self.backend.payment_method_ids.mapped("acquirer_id")
+        self.env["payment.transaction"].create(
+            [
+                {
+                    "acquirer_id": acquirers[i % len(acquirers)].id,
+                    "amount": cart.amount_total,
+                    "currency_id": cart.currency_id.id,
+                    "sale_order_ids": [(6, 0, cart.ids)],
+                }
+                for i, cart in enumerate(self.carts)
+            ]
+        )
+
+    def test_benchmark_cart_search(self):
+        self._create_transactions()
+        self._benchmark(
+            "cart.search",
+            lambda cart: self._benchmark_dispatch(
+                "cart", cart, "search", {"id": cart.id}
+            ),
+            self.carts,
+        )
+
+    def test_benchmark_sales_search(self):
+        self._create_transactions()
+        self.carts.write({"typology": "sale"})
+        self._benchmark(
+            "sales.search",
+            lambda cart: self._benchmark_dispatch(
+                "sales", cart, "search", {"per_page": len(self.carts)}
+            ),
+            self.carts,
+        )
@@ -2,10 +2,26 @@
 # @author Sébastien BEAU <sebastien.beau@akretion.com>
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+import contextlib
+from unittest import mock
+
+import odoo
+from odoo.tools.misc import DotDict
+
+from odoo.addons.invader_payment.components.event_listener import (
+    EVENT_MODE_JOB,
+    EVENT_MODE_POST_COMMIT,
+)
+from odoo.addons.invader_payment.tests.common import QueryBudgetMixin
+from odoo.addons.shopinvader import shopinvader_response
 from odoo.addons.shopinvader.tests.test_cart import CommonConnectedCartCase
 
+from ..components.payment_transaction_event_listerner import (
+    SaleOrderPaymentTransactionEventListener,
+)
 
-class ShopinvaderPaymentCase(CommonConnectedCartCase):
+
+class ShopinvaderPaymentCase(QueryBudgetMixin, CommonConnectedCartCase):
     @classmethod
     def setUpClass(cls):
         super(ShopinvaderPaymentCase, cls).setUpClass()
@@ -33,6 +49,37 @@ class ShopinvaderPaymentCase(CommonConnectedCartCase):
         vals = {"acquirer_id": acquirer_id.id, "backend_id": self.backend.id}
         self.fake_payment = self.env["shopinvader.payment"].create(vals)
 
+    def _set_payment_methods(self, count):
+        """Bind acquirers to the backend until it has count of them"""
+        missing = count - len(self.backend.payment_method_ids)
+        acquirers = self.env["payment.acquirer"].create(
+            [
+                {"name": "Fake Acquirer {}".format(i), "provider": "manual"}
+                for i in range(missing)
+            ]
+        )
+        self.env["shopinvader.payment"].create(
+            [
+                {"acquirer_id": acquirer.id, "backend_id": self.backend.id}
+                for acquirer in acquirers
+            ]
+        )
+
+    def _set_sale_transactions(self, sale, count):
+        """Create transactions for the sale until it has count of them"""
+        acquirer = self.backend.payment_method_ids[:1].acquirer_id
+        self.env["payment.transaction"].create(
+            [
+                {
+                    "acquirer_id": acquirer.id,
+                    "amount": sale.amount_total,
+                    "currency_id": sale.currency_id.id,
+                    "sale_order_ids": [(6, 0, sale.ids)],
+                }
+                for __ in range(count - len(sale.transaction_ids))
+            ]
+        )
+
     def test_no_acquirer(self):
         response = self.cart_service.dispatch(
             "search", params={"id": self.cart.id}
@@ -76,3 +123,204 @@ class ShopinvaderPaymentCase(CommonConnectedCartCase):
         transactions = response.get("data").get("transactions")
         transaction = transactions[0]
         self.assertEqual("draft", transaction.get("state"))
+
+    def test_transactions_batch_notify(self):
+        self._setup_payment_acquirer()
+        self._set_transaction()
+        self.assertEqual("cart", self.cart.typology)
+        # per-record listeners are still called through the batch adapter
+        self.transaction.with_context(invader_payment_batch_notify=True).write(
+            {"state": "done"}
+        )
+        self.assertEqual("sale", self.cart.typology)
+
+    def test_transactions_authorized(self):
+        self._setup_payment_acquirer()
+        self._set_transaction()
+        # captured at once: the cart waits for the transaction to be done
+        self.transaction.write({"state": "authorized"})
+        self.assertEqual("cart", self.cart.typology)
+
+    def _patch_event_mode(self, mode):
+        return mock.patch.object(
+            SaleOrderPaymentTransactionEventListener,
+            "_invader_get_event_mode",
+            return_value=mode,
+        )
+
+    def _patch_deferred_event(self):
+        return mock.patch.object(
+            type(self.env["payment.transaction"]),
+            "_invader_run_deferred_event",
+        )
+
+    def _get_deferred_event_args(self):
+        return (
+            SaleOrderPaymentTransactionEventListener._name,
+            "on_payment_transaction_done",
+            "sale.order",
+            self.cart.ids,
+        )
+
+    def test_transactions_event_post_commit(self):
+        self._setup_payment_acquirer()
+        self._set_transaction()
+        with self._patch_event_mode(
+            EVENT_MODE_POST_COMMIT
+        ), self._patch_deferred_event() as run_deferred_event:
+            self.transaction.write({"state": "done"})
+            # nothing runs until the commit
+            self.assertEqual("cart", self.cart.typology)
+            run_deferred_event.assert_not_called()
+            self.env.cr.postcommit.run()
+        run_deferred_event.assert_called_once_with(
+            *self._get_deferred_event_args()
+        )
+        # what the callback runs in its own cursor once committed
+        self.transaction._invader_run_deferred_event(
+            *self._get_deferred_event_args()
+        )
+        self.assertEqual("sale", self.cart.typology)
+
+    def test_transactions_event_job(self):
+        self._setup_payment_acquirer()
+        self._set_transaction()
+        with self._patch_event_mode(EVENT_MODE_JOB), mock.patch.object(
+            type(self.env["payment.transaction"]), "with_delay", create=True
+        ) as with_delay:
+            self.transaction.write({"state": "done"})
+        self.assertEqual("cart", self.cart.typology)
+        job = with_delay.return_value
+        job._invader_run_deferred_event.assert_called_once_with(
+            *self._get_deferred_event_args()
+        )
+
+    @contextlib.contextmanager
+    def _mock_request(self, cart_id):
+        request = mock.Mock(
+            context={},
+            db=self.env.cr.dbname,
+            uid=None,
+            httprequest=mock.Mock(
+                environ={"HTTP_SESS_CART_ID": cart_id}, headers={}
+            ),
+            session=DotDict(),
+        )
+        with contextlib.ExitStack() as s:
+            odoo.http._request_stack.push(request)
+            s.callback(odoo.http._request_stack.pop)
+            shopinvader_response.set_testmode(True)
+            s.callback(shopinvader_response.set_testmode, False)
+            yield shopinvader_response.get()
+
+    def test_transactions_event_deferred_session(self):
+        self._setup_payment_acquirer()
+        self._set_transaction()
+        with self._mock_request(
+            self.cart.id
+        ) as response, self._patch_event_mode(
+            EVENT_MODE_POST_COMMIT
+        ), self._patch_deferred_event():
+            self.transaction.write({"state": "done"})
+        # the cart is confirmed later on but the session is reset at once
+        self.assertEqual("cart", self.cart.typology)
+        self.assertEqual(0, response.session["cart_id"])
+        self.assertEqual({}, response.store_cache["cart"])
+        self.assertEqual(
+            {"id": self.cart.id}, response.store_cache["last_sale"]
+        )
+
+    def test_transactions_event_post_commit_failure(self):
+        self._setup_payment_acquirer()
+        self._set_transaction()
+        with self._patch_event_mode(
+            EVENT_MODE_POST_COMMIT
+        ), self._patch_deferred_event() as run_deferred_event, mock.patch.object(
+            type(self.env["payment.transaction"]),
+            "_invader_deferred_event_failed",
+        ) as deferred_event_failed:
+            run_deferred_event.side_effect = Exception("boom")
+            self.transaction.write({"state": "done"})
+            self.env.cr.postcommit.run()
+        # the failure is not swallowed: the event is retried from a job
+        deferred_event_failed.assert_called_once_with(
+            *self._get_deferred_event_args()
+        )
+
+    def test_transactions_payables_map(self):
+        self._setup_payment_acquirer()
+        self._set_transaction()
+        transaction_without_sale = self.env["payment.transaction"].create(
+            {
+                "acquirer_id": self.fake_payment.acquirer_id.id,
+                "amount": 10,
+                "currency_id": self.cart.currency_id.id,
+            }
+        )
+        transactions = self.transaction | transaction_without_sale
+        payables_map = transactions._get_invader_payables_map()
+        self.assertEqual(self.cart, payables_map[self.transaction])
+        self.assertFalse(payables_map[transaction_without_sale])
+
+    def test_transactions_to_json_multi(self):
+        self._setup_payment_acquirer()
+        self._set_transaction()
+        other_sale = self.env.ref("shopinvader.sale_order_1")
+        sales = self.cart | other_sale
+        payment = self.cart_service.component(usage="invader.payment")
+        res = payment._to_json_multi(sales)
+        for sale in sales:
+            self.assertEqual(
+                payment._to_json(sale._invader_get_transactions()), res[sale]
+            )
+        self.assertEqual(1, len(res[self.cart]["transactions"]))
+
+    def test_acquirer_config_snapshot(self):
+        self._setup_payment_acquirer()
+        acquirer = self.fake_payment.acquirer_id
+        config = acquirer._invader_get_config()
+        self.assertEqual("manual", config["provider"])
+        self.assertIs(config, acquirer._invader_get_config())
+        acquirer.state = "test"
+        self.assertEqual("test", acquirer._invader_get_config()["state"])
+
+    def test_cart_search_query_budget(self):
+        for count in (1, 5):
+            self._set_payment_methods(count)
+            self._set_sale_transactions(self.cart, count)
+            with self.assertQueryBudget(
+                45, payment_methods=(1, count), transactions=(1, count)
+            ):
+                response = self.cart_service.dispatch(
+                    "search", params={"id": self.cart.id}
+                )
+            self.assertEqual(count, len(response["data"]["transactions"]))
+
+    def test_sales_search_query_budget(self):
+        self._set_payment_methods(1)
+        with self.work_on_services(partner=self.partner) as work:
+            sale_service = work.component(usage="sales")
+        sales = self.env["sale.order"].search(
+            [
+                ("partner_id", "=", self.partner.id),
+                ("shopinvader_backend_id", "=", self.backend.id),
+                ("typology", "=", "sale"),
+            ]
+        )
+        for count in (1, 5):
+            while len(sales) < count:
+                sales |= self.cart.copy(
+                    {
+                        "typology": "sale",
+                        "shopinvader_backend_id": self.backend.id,
+                    }
+                )
+            for sale in sales:
+                self._set_sale_transactions(sale, count)
+            with self.assertQueryBudget(
+                30, sales=(3, len(sales)), transactions=(1, count)
+            ):
+                response = sale_service.dispatch(
+                    "search", params={"per_page": len(sales)}
+                )
+            self.assertTrue(response["data"])
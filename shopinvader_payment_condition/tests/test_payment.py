@@ -2,10 +2,11 @@
 # @author Iván Todorovich <ivan.todorovich@camptocamp.com>
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+from odoo.addons.invader_payment.tests.common import QueryBudgetMixin
 from odoo.addons.shopinvader.tests.test_cart import CommonConnectedCartCase
 
 
-class ShopinvaderPaymentCase(CommonConnectedCartCase):
+class ShopinvaderPaymentCase(QueryBudgetMixin, CommonConnectedCartCase):
     def setUp(self):
         super().setUp()
         # TODO: This should be in setUpClass, but it needs to be changed
@@ -59,3 +60,33 @@ class ShopinvaderPaymentCase(CommonConnectedCartCase):
             set(self.acquirer_a.ids),
             "Second payment method should be filtered out, country doesn't match",
         )
+
+    def test_search_query_budget(self):
+        self.cart.partner_invoice_id.country_id = self.env.ref("base.fr")
+        payments = self.payment_a | self.payment_b
+        for count in (1, 5):
+            conditions = payments.filtered("domain")
+            for i in range(count - len(conditions)):
+                acquirer = self.env["payment.acquirer"].create(
+                    {
+                        "name": "Fake Acquirer {}".format(i),
+                        "provider": "manual",
+                    }
+                )
+                payments |= self.env["shopinvader.payment"].create(
+                    {
+                        "acquirer_id": acquirer.id,
+                        "backend_id": self.backend.id,
+                        "domain": "[('partner_invoice_id.country_id.code', "
+                        "'in', ['FR', 'BE'])]",
+                    }
+                )
+            with self.assertQueryBudget(
+                45, payment_methods=(1, len(payments)), conditions=(1, count)
+            ):
+                data = self.service.dispatch(
+                    "search", params={"id": self.cart.id}
+                )["data"]
+            self.assertEqual(
+                len(payments), data["payment"]["available_methods"]["count"]
+            )
@@ -6,6 +6,11 @@ from odoo.addons.component.core import Component
 class SaleOrderPaymentTransactionEventListener(Component):
     _inherit = "sale.order.payment.transaction.event.listener"
 
+    def _must_confirm(self, event_name, transaction):
+        if event_name == "on_payment_transaction_pending":
+            return transaction.acquirer_id.provider == "transfer"
+        return super()._must_confirm(event_name, transaction)
+
     def on_payment_transaction_pending(self, sale_order, transaction):
-        if transaction.acquirer_id.provider == "transfer":
+        if self._must_confirm("on_payment_transaction_pending", transaction):
             self._confirm_and_invalidate_session(sale_order)
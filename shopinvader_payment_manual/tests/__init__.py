@@ -1 +1,2 @@
 from . import test_payment_manual
+from . import test_benchmark
@@ -0,0 +1,36 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo.tests import tagged
+
+from odoo.addons.invader_payment.tests.benchmark import BenchmarkMixin
+from odoo.addons.shopinvader.tests.test_cart import CommonConnectedCartCase
+
+
+@tagged("-standard", "invader_benchmark")
+class ShopinvaderManualPaymentBenchmarkCase(
+    BenchmarkMixin, CommonConnectedCartCase
+):
+    def setUp(self):
+        super().setUp()
+        self.acquirer = self.env.ref("payment.payment_acquirer_transfer")
+        self.carts = self._benchmark_copy_carts()
+
+    def test_benchmark_add_payment(self):
+        self._benchmark(
+            "payment_manual.add_payment",
+            lambda cart: self._benchmark_dispatch(
+                "payment_manual",
+                cart,
+                "add_payment",
+                {
+                    "target": "current_cart",
+                    "payment_mode_id": self.acquirer.id,
+                },
+            ),
+            self.carts,
+        )
+        self.assertEqual(
+            ["pending"] * len(self.carts),
+            self.carts.mapped("transaction_ids.state"),
+        )
@@ -8,10 +8,12 @@ import odoo
 from odoo.exceptions import UserError
 from odoo.tools.misc import DotDict
 
+from odoo.addons.invader_payment import metrics
+from odoo.addons.invader_payment.tests.common import QueryBudgetMixin
 from odoo.addons.shopinvader.tests.test_cart import CommonConnectedCartCase
 
 
-class ShopinvaderManualPaymentCase(CommonConnectedCartCase):
+class ShopinvaderManualPaymentCase(QueryBudgetMixin, CommonConnectedCartCase):
     @contextlib.contextmanager
     def _mock_request(self, cart_id):
         request = Mock(
@@ -86,3 +88,108 @@ class ShopinvaderManualPaymentCase(CommonConnectedCartCase):
                 },
             )
         self.assertEqual(self.cart.typology, "cart")
+
+    def test_no_payment_mode(self):
+        with self.assertRaises(UserError) as m:
+            self.payment_service.dispatch(
+                "add_payment",
+                params={"target": "current_cart", "payment_mode_id": 0},
+            )
+        self.assertEqual(
+            m.exception.name,
+            "Payment mode acquirer mismatch should be "
+            "'transfer' instead of 'False'.",
+        )
+        self.assertFalse(self.cart.transaction_ids)
+
+    def test_static_validator_cached(self):
+        validator_component = self.payment_service.component(
+            usage="cerberus.validator"
+        )
+        validators = [
+            validator_component.get_validator_handler(
+                self.payment_service, "_validator_add_payment", "input"
+            )()
+            for __ in range(2)
+        ]
+        self.assertIs(validators[0], validators[1])
+        self.assertIn("target", validators[0].schema)
+
+    def test_payment_manual_service_idempotency_key(self):
+        params = {
+            "target": "current_cart",
+            "payment_mode_id": self.acquirer.id,
+            "idempotency_key": "4f8a2c1e",
+        }
+        with self._mock_request(self.shopinvader_session["cart_id"]):
+            self.payment_service.dispatch("add_payment", params=params)
+            # replay: the stored response is returned, no new transaction
+            self.payment_service.dispatch("add_payment", params=params)
+        self.assertEqual(1, len(self.cart.transaction_ids))
+        with self.assertRaises(UserError):
+            self.payment_service.dispatch(
+                "add_payment", params=dict(params, payment_mode_id=0)
+            )
+
+    def test_payment_manual_service_idempotency_key_guests(self):
+        params = {
+            "target": "current_cart",
+            "payment_mode_id": self.acquirer.id,
+            "idempotency_key": "4f8a2c1e",
+        }
+        other_cart = self.cart.copy(
+            {"typology": "cart", "shopinvader_backend_id": self.backend.id}
+        )
+        responses = []
+        for cart in (self.cart, other_cart):
+            with self.work_on_services(
+                partner=None, shopinvader_session={"cart_id": cart.id}
+            ) as work:
+                payment_service = work.component(usage="payment_manual")
+            with self._mock_request(cart.id):
+                responses.append(
+                    payment_service.dispatch("add_payment", params=params)
+                )
+        # the guests reusing a key do not share the stored response
+        self.assertEqual(
+            [self.cart.id, other_cart.id],
+            [res["store_cache"]["last_sale"]["id"] for res in responses],
+        )
+        self.assertEqual(1, len(self.cart.transaction_ids))
+        self.assertEqual(1, len(other_cart.transaction_ids))
+
+    def test_payment_manual_service_metrics(self):
+        metrics.registry.reset()
+        with self._mock_request(self.shopinvader_session["cart_id"]):
+            self.payment_service.dispatch(
+                "add_payment",
+                params={
+                    "target": "current_cart",
+                    "payment_mode_id": self.acquirer.id,
+                },
+            )
+        for phase in (
+            "payable_resolution",
+            "provider_check",
+            "transaction_create",
+        ):
+            stats = metrics.registry.get_span("payment_manual." + phase)
+            self.assertEqual(stats["count"], 1)
+        stats = metrics.registry.get_span("payment_manual.transaction_create")
+        self.assertTrue(stats["queries"])
+        self.assertTrue(
+            metrics.registry.get_span("invader_payment.event_notification")
+        )
+
+    def test_payment_manual_service_query_budget(self):
+        with self._mock_request(
+            self.shopinvader_session["cart_id"]
+        ), self.assertQueryBudget(45):
+            self.payment_service.dispatch(
+                "add_payment",
+                params={
+                    "target": "current_cart",
+                    "payment_mode_id": self.acquirer.id,
+                },
+            )
+        self.assertEqual("pending", self.cart.transaction_ids.state)
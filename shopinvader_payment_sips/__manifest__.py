@@ -4,12 +4,13 @@
 {
     "name": "SIPS Payment Acquirer (REST, Shopinvader)",
     "summary": "Shopinvader REST Services for Worldline SIPS Payments",
-    "version": "13.0.1.0.0",
+    "version": "14.0.1.0.0",
     "author": "ACSONE SA/NV",
     "website": "https://github.com/shopinvader/odoo-shopinvader-payment",
     "license": "AGPL-3",
     "category": "e-commerce",
     "depends": ["shopinvader_payment", "invader_payment_sips"],
+    "demo": ["demo/payment_demo.xml"],
     "autoinstall": True,
-    "installable": False,
+    "installable": True,
 }
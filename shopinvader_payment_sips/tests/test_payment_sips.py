@@ -0,0 +1,394 @@
+# Copyright 2019 Akretion (http://www.akretion.com).
+# @author Sébastien BEAU <sebastien.beau@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import base64
+import io
+from datetime import datetime, timedelta
+
+from odoo import _
+from odoo.exceptions import UserError
+
+from odoo.addons.invader_payment.tests.common import QueryBudgetMixin
+from odoo.addons.invader_payment_sips.models.payment_transaction import (
+    SIPS_OFFICE_URL_PARAM,
+)
+from odoo.addons.invader_payment_sips.services.payment_sips import (
+    _sips_make_data,
+    _sips_make_seal,
+    _sips_parse_data,
+    _sips_seal_check,
+)
+from odoo.addons.invader_payment_sips.tests.sips_office_stand_in import (
+    SipsOfficeStandIn,
+)
+from odoo.addons.shopinvader.tests.test_cart import CommonConnectedCartCase
+
+MERCHAND_ID = "002001000000001"
+SECRET_KEY = "002001000000001_KEY1"
+KEY_VERSION = 1
+
+NORMAL_RETURN_URL = (
+    "https://shopinvader.com/invader/payment_sips/normal_return?"
+    "success_redirect=/cart/validation"
+    "&cancel_redirect=/cart/checkout?canceled_payment=sips"
+    "&target=current_cart"
+)
+
+AUTOMATIC_RESPONSE_URL = (
+    "https://shopinvader.com/invader/payment_sips/automatic_response"
+)
+
+
+class ShopinvaderSipsPaymentCase(QueryBudgetMixin, CommonConnectedCartCase):
+    def setUp(self, *args, **kwargs):
+        super(ShopinvaderSipsPaymentCase, self).setUp(*args, **kwargs)
+        self.acquirer = acquirer = self.env.ref(
+            "payment.payment_acquirer_sips"
+        )
+        acquirer.write(
+            {"sips_secret": SECRET_KEY, "sips_merchant_id": MERCHAND_ID}
+        )
+        self.env["ir.config_parameter"].set_param("sips.key_version", 1)
+        with self.work_on_services(
+            partner=self.partner, shopinvader_session=self.shopinvader_session
+        ) as work:
+            self.service = work.component(usage="payment_sips")
+
+    def test_prepare_payment(self):
+        result = self.service.dispatch(
+            "prepare_payment",
+            params={
+                "target": "current_cart",
+                "payment_mode_id": self.acquirer.id,
+                "normal_return_url": NORMAL_RETURN_URL,
+                "automatic_response_url": AUTOMATIC_RESPONSE_URL,
+            },
+        )
+        self.assertTrue(
+            _sips_seal_check(
+                result["sips_data"], result["sips_seal"], SECRET_KEY
+            )
+        )
+        self.assertEqual(
+            self.acquirer.sips_get_form_action_url(),
+            result["sips_form_action_url"],
+        )
+        data = _sips_parse_data(result["sips_data"])
+        self.assertEqual(
+            self.cart.transaction_ids.reference, data["transactionReference"]
+        )
+        self.assertEqual(
+            str(int(round(self.cart.amount_total * 100))), data["amount"]
+        )
+        self.assertEqual(MERCHAND_ID, data["merchantId"])
+        self.assertEqual(AUTOMATIC_RESPONSE_URL, data["automaticResponseUrl"])
+
+    def test_wrong_provider_prepare_payment(self):
+        self.payment_mode_check = self.env.ref(
+            "payment.payment_acquirer_transfer"
+        )
+        with self.assertRaises(UserError) as m:
+            self.service.dispatch(
+                "prepare_payment",
+                params={
+                    "target": "current_cart",
+                    "payment_mode_id": self.payment_mode_check.id,
+                    "normal_return_url": NORMAL_RETURN_URL,
+                    "automatic_response_url": AUTOMATIC_RESPONSE_URL,
+                },
+            )
+        self.assertEqual(
+            m.exception.name,
+            _(
+                "Payment mode acquirer mismatch should be "
+                "'sips' instead of 'transfer'."
+            ),
+        )
+
+    def test_automatic_response_query_budget(self):
+        result = self.service.dispatch(
+            "prepare_payment",
+            params={
+                "target": "current_cart",
+                "payment_mode_id": self.acquirer.id,
+                "normal_return_url": NORMAL_RETURN_URL,
+                "automatic_response_url": AUTOMATIC_RESPONSE_URL,
+            },
+        )
+        reference = _sips_parse_data(result["sips_data"])[
+            "transactionReference"
+        ]
+        data = _sips_make_data(
+            {"transactionReference": reference, "responseCode": "00"}
+        )
+        params = {"Data": data, "Seal": _sips_make_seal(data, SECRET_KEY)}
+        # cart confirmation included
+        with self.assertQueryBudget(90):
+            self.service.dispatch("automatic_response", params=params)
+        transaction = self.env["payment.transaction"].search(
+            [("reference", "=", reference)]
+        )
+        self.assertEqual("done", transaction.state)
+
+    def _get_sips_response_params(self, response_code):
+        result = self.service.dispatch(
+            "prepare_payment",
+            params={
+                "target": "current_cart",
+                "payment_mode_id": self.acquirer.id,
+                "normal_return_url": NORMAL_RETURN_URL,
+                "automatic_response_url": AUTOMATIC_RESPONSE_URL,
+            },
+        )
+        reference = _sips_parse_data(result["sips_data"])[
+            "transactionReference"
+        ]
+        data = _sips_make_data(
+            {"transactionReference": reference, "responseCode": response_code}
+        )
+        return {"Data": data, "Seal": _sips_make_seal(data, SECRET_KEY)}
+
+    def test_automatic_response_once(self):
+        params = self._get_sips_response_params("00")
+        self.service.dispatch("automatic_response", params=params)
+        transaction_obj = self.env["payment.transaction"]
+        transaction = transaction_obj._invader_sips_lock_transaction(
+            _sips_parse_data(params["Data"])["transactionReference"]
+        )[0]
+        self.assertEqual("done", transaction.state)
+        # the response repeated (or the return of the customer) is a no-op
+        self.assertFalse(
+            transaction._invader_sips_apply_response({"responseCode": "05"})
+        )
+        self.assertEqual(
+            transaction,
+            transaction_obj._invader_sips_process_response(
+                params["Data"], params["Seal"], skip_locked=True
+            ),
+        )
+        self.assertEqual("done", transaction.state)
+
+    def test_automatic_response_invalid_seal(self):
+        params = self._get_sips_response_params("00")
+        with self.assertRaises(UserError):
+            self.service.dispatch(
+                "automatic_response",
+                params=dict(params, Seal=_sips_make_seal(params["Data"], "")),
+            )
+
+    def test_automatic_response_async(self):
+        self.acquirer.sips_async_automatic_response = True
+        params = self._get_sips_response_params("00")
+        self.service.dispatch("automatic_response", params=params)
+        response = self.env["invader.sips.response"].search(
+            [("data", "=", params["Data"])]
+        )
+        self.assertEqual("pending", response.state)
+        self.assertEqual("draft", response.transaction_id.state)
+        self.env["invader.sips.response"]._cron_process_responses()
+        self.assertEqual("done", response.state)
+        self.assertEqual("done", response.transaction_id.state)
+        # the done responses are removed after the TTL
+        response_obj = self.env["invader.sips.response"]
+        response_obj._gc_done_responses()
+        self.assertTrue(response.exists())
+        response.write({"date": datetime.now() - timedelta(days=8)})
+        response_obj._gc_done_responses()
+        self.assertFalse(response.exists())
+
+    def test_prepare_sips_data_amount(self):
+        transaction = self.env["payment.transaction"].create(
+            {
+                "acquirer_id": self.acquirer.id,
+                "reference": "TEST-SIPS-AMOUNT",
+                "amount": 19.99,
+                "currency_id": self.env.ref("base.EUR").id,
+                "partner_id": self.env.ref("base.res_partner_1").id,
+            }
+        )
+        data = self.service._prepare_sips_data(
+            transaction, NORMAL_RETURN_URL, AUTOMATIC_RESPONSE_URL
+        )
+        self.assertEqual(1999, data["amount"])
+        self.assertEqual("978", data["currencyCode"])
+        self.assertEqual("1", data["keyVersion"])
+        # JPY has no decimals
+        transaction.write(
+            {"amount": 1500.0, "currency_id": self.env.ref("base.JPY").id}
+        )
+        data = self.service._prepare_sips_data(
+            transaction, NORMAL_RETURN_URL, AUTOMATIC_RESPONSE_URL
+        )
+        self.assertEqual(1500, data["amount"])
+
+    def test_sips_context_cached(self):
+        context = self.acquirer._invader_get_sips_context()
+        self.assertEqual(MERCHAND_ID, context["merchant_id"])
+        with self.assertQueryCount(0):
+            self.assertIs(context, self.acquirer._invader_get_sips_context())
+        # rebuilt on a change of the key version or of the acquirer
+        self.env["ir.config_parameter"].set_param("sips.key_version", 2)
+        self.assertEqual(
+            "2", self.acquirer._invader_get_sips_context()["key_version"]
+        )
+        self.acquirer.sips_merchant_id = "002001000000002"
+        self.assertEqual(
+            "002001000000002",
+            self.acquirer._invader_get_sips_context()["merchant_id"],
+        )
+
+    def test_import_report(self):
+        references = [
+            _sips_parse_data(self._get_sips_response_params(code)["Data"])[
+                "transactionReference"
+            ]
+            for code in ("00", "05", "00")
+        ]
+        transaction_obj = self.env["payment.transaction"]
+        canceled = transaction_obj.search([("reference", "=", references[2])])
+        canceled._set_transaction_cancel()
+        report = io.StringIO(
+            "\n".join(
+                [
+                    _sips_make_data(
+                        {
+                            "transactionReference": references[0],
+                            "responseCode": "00",
+                        }
+                    ),
+                    _sips_make_data(
+                        {
+                            "transactionReference": references[1],
+                            "responseCode": "05",
+                        }
+                    ),
+                    _sips_make_data(
+                        {
+                            "transactionReference": references[2],
+                            "responseCode": "00",
+                        }
+                    ),
+                    _sips_make_data(
+                        {
+                            "transactionReference": "UNKNOWN",
+                            "responseCode": "00",
+                        }
+                    ),
+                    "invalid line",
+                    "",
+                ]
+            )
+        )
+        stats = transaction_obj._invader_sips_import_report(
+            report, chunk_size=2
+        )
+        # the canceled transaction paid is left to a manual review
+        self.assertEqual(
+            {
+                "lines": 5,
+                "invalid": 1,
+                "unknown": 1,
+                "updated": 2,
+                "conflicts": 1,
+                "conflict_references": [references[2]],
+            },
+            stats,
+        )
+        transactions = transaction_obj.search(
+            [("reference", "in", references)]
+        )
+        self.assertEqual(
+            ["done", "cancel", "cancel"],
+            [
+                transactions.filtered(lambda t: t.reference == r).state
+                for r in references
+            ],
+        )
+        # imported again with the wizard: nothing to correct
+        wizard = self.env["invader.sips.report.import"].create(
+            {
+                "report_file": base64.b64encode(
+                    report.getvalue().encode("utf-8")
+                )
+            }
+        )
+        wizard.action_import()
+        self.assertEqual("done", wizard.state)
+        self.assertEqual(5, wizard.lines)
+        self.assertEqual(0, wizard.updated)
+        self.assertEqual(1, wizard.conflicts)
+        self.assertEqual(references[2], wizard.conflict_references)
+
+    def test_poll_draft_transactions(self):
+        references = [
+            _sips_parse_data(self._get_sips_response_params("00")["Data"])[
+                "transactionReference"
+            ]
+            for __ in range(5)
+        ]
+        transactions = self.env["payment.transaction"].search(
+            [("reference", "in", references)], order="id"
+        )
+        # the fourth one is too recent to be polled
+        now = datetime.now()
+        self.env.cr.execute(
+            "UPDATE payment_transaction SET create_date = %s WHERE id IN %s",
+            (
+                now - timedelta(days=2),
+                tuple((transactions[:2] | transactions[4]).ids),
+            ),
+        )
+        self.env.cr.execute(
+            "UPDATE payment_transaction SET create_date = %s WHERE id = %s",
+            (now - timedelta(hours=1), transactions[2].id),
+        )
+        transactions.invalidate_cache()
+        with SipsOfficeStandIn(secret=SECRET_KEY) as server:
+            self.env["ir.config_parameter"].set_param(
+                SIPS_OFFICE_URL_PARAM, server.url
+            )
+            server.transactions[references[0]] = {
+                "transactionStatus": "CAPTURED"
+            }
+            server.transactions[references[3]] = {
+                "transactionStatus": "CAPTURED"
+            }
+            # not final yet: left for the next run
+            server.transactions[references[4]] = {
+                "transactionStatus": "PENDING"
+            }
+            self.env["payment.transaction"]._cron_poll_sips_transactions()
+        self.assertEqual(4, server.requests_count)
+        self.assertEqual(
+            ["done", "cancel", "draft", "draft", "draft"],
+            transactions.mapped("state"),
+        )
+
+    def test_poll_draft_transactions_office_failing(self):
+        references = [
+            _sips_parse_data(self._get_sips_response_params("00")["Data"])[
+                "transactionReference"
+            ]
+            for __ in range(2)
+        ]
+        transactions = self.env["payment.transaction"].search(
+            [("reference", "in", references)], order="id"
+        )
+        now = datetime.now()
+        self.env.cr.execute(
+            "UPDATE payment_transaction SET create_date = %s WHERE id = %s",
+            (now - timedelta(days=2), transactions[0].id),
+        )
+        self.env.cr.execute(
+            "UPDATE payment_transaction SET create_date = %s WHERE id = %s",
+            (now - timedelta(hours=1), transactions[1].id),
+        )
+        transactions.invalidate_cache()
+        with SipsOfficeStandIn(secret=SECRET_KEY, error_rate=1.0) as server:
+            self.env["ir.config_parameter"].set_param(
+                SIPS_OFFICE_URL_PARAM, server.url
+            )
+            self.env["payment.transaction"]._cron_poll_sips_transactions()
+        # the outcome is unknown: the transactions may be paid
+        self.assertEqual(["draft", "draft"], transactions.mapped("state"))
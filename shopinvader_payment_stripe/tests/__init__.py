@@ -1 +1,2 @@
 from . import test_payment_stripe
+from . import test_benchmark
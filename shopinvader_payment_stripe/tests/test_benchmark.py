@@ -0,0 +1,48 @@
+# Copyright 2019 ACSONE SA/NV (http://acsone.eu).
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo.tests import tagged
+
+from odoo.addons.invader_payment.tests.benchmark import BenchmarkMixin
+from odoo.addons.invader_payment_stripe.tests.stripe_stand_in import (
+    StripeStandIn,
+)
+from odoo.addons.shopinvader.tests.test_cart import CommonConnectedCartCase
+
+
+@tagged("-standard", "invader_benchmark")
+class ShopinvaderStripePaymentBenchmarkCase(
+    BenchmarkMixin, CommonConnectedCartCase
+):
+    def setUp(self):
+        super().setUp()
+        self.acquirer = self.env.ref("payment.payment_acquirer_stripe")
+        self.acquirer.journal_id = self.env["account.journal"].search(
+            [("code", "=", "BNK1")]
+        )
+        self.carts = self._benchmark_copy_carts()
+
+    def test_benchmark_confirm_payment(self):
+        # the Stripe API is answered locally: only its latency is simulated
+        with StripeStandIn(latency=0.05) as server:
+            self.acquirer.write(
+                {
+                    "stripe_secret_key": "sk_test_benchmark",
+                    "stripe_api_base": server.api_base,
+                }
+            )
+            results = self._benchmark(
+                "payment_stripe.confirm_payment",
+                lambda cart: self._benchmark_dispatch(
+                    "payment_stripe",
+                    cart,
+                    "confirm_payment",
+                    {
+                        "target": "current_cart",
+                        "payment_mode_id": self.acquirer.id,
+                        "stripe_payment_method_id": "pm_card_visa",
+                    },
+                ),
+                self.carts,
+            )
+        self.assertEqual([{"success": True}] * len(self.carts), results)
@@ -1,17 +1,28 @@
 # Copyright 2020 ACSONE SA/NV (http://acsone.eu).
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+import json
+import time
 from datetime import datetime, timedelta
 
 import mock
-from stripe import PaymentIntent
+from stripe import PaymentIntent, WebhookSignature
 
+from odoo.exceptions import UserError
+
+from odoo.addons.invader_payment import metrics
+from odoo.addons.invader_payment.tests.common import QueryBudgetMixin
+from odoo.addons.invader_payment_stripe import circuit_breaker
 from odoo.addons.invader_payment_stripe.services.payment_stripe import (
     PaymentServiceStripe,
 )
+from odoo.addons.invader_payment_stripe.stripe_client import StripeClient
+from odoo.addons.invader_payment_stripe.tests.stripe_stand_in import (
+    StripeStandIn,
+)
 from odoo.addons.shopinvader.tests.test_cart import CommonConnectedCartCase
 
 
-class ShopinvaderStripePaymentCase(CommonConnectedCartCase):
+class ShopinvaderStripePaymentCase(QueryBudgetMixin, CommonConnectedCartCase):
     def setUp(self, *args, **kwargs):
         super(ShopinvaderStripePaymentCase, self).setUp(*args, **kwargs)
         self.acquirer = self.env.ref("payment.payment_acquirer_stripe")
@@ -56,3 +67,649 @@ class ShopinvaderStripePaymentCase(CommonConnectedCartCase):
         )
         self.env["payment.transaction"]._cron_post_process_after_done()
         self.assertEqual("sale", self.cart.state)
+
+    def test_payment_stripe_service_query_budget(self):
+        with mock.patch.object(
+            PaymentServiceStripe, "_prepare_stripe_intent"
+        ) as mock_service:
+            intent = PaymentIntent(id="test_response")
+            intent.status = "succeeded"
+            mock_service.return_value = intent
+            # transaction creation and cart confirmation included
+            with self.assertQueryBudget(90):
+                self.payment_service.dispatch(
+                    "confirm_payment",
+                    params={
+                        "target": "current_cart",
+                        "payment_mode_id": self.acquirer.id,
+                        "stripe_payment_method_id": "pm_123456789",
+                    },
+                )
+        self.assertEqual("done", self.cart.transaction_ids.state)
+
+    def test_payment_stripe_client_pooled(self):
+        self.acquirer.stripe_secret_key = "sk_test_pool"
+        transaction = self.env["payment.transaction"].create(
+            self.cart._invader_prepare_payment_transaction_data(self.acquirer)
+        )
+        client = self.payment_service._get_stripe_client(transaction)
+        self.assertIs(
+            client, self.payment_service._get_stripe_client(transaction)
+        )
+        self.acquirer.stripe_timeout = 5
+        other_client = self.payment_service._get_stripe_client(transaction)
+        self.assertIsNot(client, other_client)
+        self.assertEqual(5, other_client.http_client._timeout)
+        # no need to wait longer than the latency budget for a read
+        self.acquirer.stripe_latency_budget = 2.5
+        client = self.payment_service._get_stripe_client(
+            transaction, read_only=True
+        )
+        self.assertEqual(2.5, client.http_client._timeout)
+        # but the outcome of a timed out creation or confirmation is unknown
+        client = self.payment_service._get_stripe_client(transaction)
+        self.assertEqual(5, client.http_client._timeout)
+
+    def test_payment_stripe_transaction_from_intent(self):
+        transaction_obj = self.env["payment.transaction"]
+        transaction = transaction_obj.create(
+            self.cart._invader_prepare_payment_transaction_data(self.acquirer)
+        )
+        transaction.acquirer_reference = "pi_lookup"
+        other_acquirer = self.env["payment.acquirer"].create(
+            {"name": "Other Acquirer", "provider": "manual"}
+        )
+        transaction_obj.create(
+            {
+                "acquirer_id": other_acquirer.id,
+                "amount": 10,
+                "currency_id": self.cart.currency_id.id,
+                "acquirer_reference": "pi_other",
+            }
+        )
+        self.assertFalse(
+            transaction_obj._invader_get_stripe_transaction_from_intent(
+                "pi_other"
+            )
+        )
+        self.assertEqual(
+            transaction,
+            transaction_obj._invader_get_stripe_transaction_from_intent(
+                "pi_lookup"
+            ),
+        )
+        # the Stripe acquirer ids are cached: a single query on the index
+        with self.assertQueryBudget(1):
+            transaction_obj._invader_get_stripe_transaction_from_intent(
+                "pi_lookup"
+            )
+        transaction.acquirer_reference = "pi_changed"
+        self.assertFalse(
+            transaction_obj._invader_get_stripe_transaction_from_intent(
+                "pi_lookup"
+            )
+        )
+
+    def _get_webhook_signature(self, payload, secret):
+        timestamp = int(time.time())
+        signature = WebhookSignature._compute_signature(
+            "{}.{}".format(timestamp, payload), secret
+        )
+        return "t={},v1={}".format(timestamp, signature)
+
+    def test_payment_stripe_webhook(self):
+        self.acquirer.stripe_webhook_secret = "whsec_test"
+        transaction = self.env["payment.transaction"].create(
+            self.cart._invader_prepare_payment_transaction_data(self.acquirer)
+        )
+        transaction.write(
+            {"acquirer_reference": "pi_webhook", "state": "pending"}
+        )
+        payload = json.dumps(
+            {
+                "id": "evt_webhook",
+                "object": "event",
+                "type": "payment_intent.succeeded",
+                "created": int(time.time()),
+                "data": {
+                    "object": {
+                        "id": "pi_webhook",
+                        "object": "payment_intent",
+                        "status": "succeeded",
+                    }
+                },
+            }
+        )
+        event_obj = self.env["invader.stripe.event"]
+        with self.assertRaises(UserError):
+            event_obj._receive_webhook(
+                self.acquirer.id,
+                payload.encode("utf-8"),
+                self._get_webhook_signature(payload, "wrong_secret"),
+            )
+        other_acquirer = self.env["payment.acquirer"].create(
+            {
+                "name": "Other Stripe",
+                "provider": "stripe",
+                "stripe_webhook_secret": "whsec_other",
+            }
+        )
+        with self.assertRaises(UserError):
+            # checked with the secret of the acquirer of the url only
+            event_obj._receive_webhook(
+                other_acquirer.id,
+                payload.encode("utf-8"),
+                self._get_webhook_signature(payload, "whsec_test"),
+            )
+        # the event is stored once
+        for __ in range(2):
+            event_obj._receive_webhook(
+                self.acquirer.id,
+                payload.encode("utf-8"),
+                self._get_webhook_signature(payload, "whsec_test"),
+            )
+        event = event_obj.search([("event_id", "=", "evt_webhook")])
+        self.assertEqual(1, len(event))
+        self.assertEqual("pending", event.state)
+        event._cron_process_events()
+        self.assertEqual("done", event.state)
+        self.assertEqual("done", transaction.state)
+        self.assertEqual("sale", self.cart.typology)
+
+    def test_payment_stripe_service_two_phase(self):
+        self.acquirer.stripe_two_phase_confirm = True
+        # the draft transaction is committed on a cursor of its own
+        self.registry.enter_test_mode(self.cr)
+        self.addCleanup(self.registry.leave_test_mode)
+        with mock.patch.object(
+            PaymentServiceStripe, "_prepare_stripe_intent"
+        ) as mock_service:
+            intent = PaymentIntent(id="test_two_phase")
+            intent.status = "succeeded"
+
+            def prepare_stripe_intent(transaction, payment_method_id):
+                self.assertNotEqual(self.cr, transaction.env.cr)
+                self.assertEqual("draft", transaction.state)
+                return intent
+
+            mock_service.side_effect = prepare_stripe_intent
+            res = self.payment_service.dispatch(
+                "confirm_payment",
+                params={
+                    "target": "current_cart",
+                    "payment_mode_id": self.acquirer.id,
+                    "stripe_payment_method_id": "pm_123456789",
+                },
+            )
+        self.assertEqual({"success": True}, res)
+        # the request cursor is not committed
+        self.cr.commit.assert_not_called()
+        self.cart.invalidate_cache()
+        self.assertEqual("done", self.cart.transaction_ids.state)
+        self.assertEqual(
+            "test_two_phase", self.cart.transaction_ids.acquirer_reference
+        )
+
+    def test_payment_stripe_reconcile(self):
+        self.acquirer.stripe_secret_key = "sk_test_reconcile"
+        transactions = self.env["payment.transaction"].browse()
+        for intent_id in (
+            "pi_late",
+            "pi_succeeded",
+            "pi_canceled",
+            "pi_processing",
+        ):
+            transaction = self.env["payment.transaction"].create(
+                self.cart._invader_prepare_payment_transaction_data(
+                    self.acquirer
+                )
+            )
+            transaction.write(
+                {"acquirer_reference": intent_id, "state": "pending"}
+            )
+            transactions |= transaction
+        self.env["base"].flush()
+        self.env.cr.execute(
+            "UPDATE payment_transaction SET create_date = %s WHERE id IN %s",
+            (datetime.now() - timedelta(hours=1), tuple(transactions.ids)),
+        )
+        transactions.invalidate_cache()
+        # confirmed later by the customer
+        transactions[0].state = "draft"
+        statuses = {
+            "pi_late": "succeeded",
+            "pi_succeeded": "succeeded",
+            "pi_canceled": "canceled",
+            "pi_processing": "processing",
+        }
+
+        def retrieve_payment_intent(client, intent_id):
+            return PaymentIntent.construct_from(
+                {"id": intent_id, "status": statuses[intent_id]},
+                client.api_key,
+            )
+
+        with mock.patch.object(
+            StripeClient,
+            "retrieve_payment_intent",
+            autospec=True,
+            side_effect=retrieve_payment_intent,
+        ) as retrieve:
+            self.env[
+                "payment.transaction"
+            ]._cron_reconcile_stripe_transactions()
+            self.assertEqual(
+                ["draft", "done", "cancel", "pending"],
+                transactions.mapped("state"),
+            )
+            # the pending transaction will be reconciled again
+            self.assertTrue(transactions[3].invader_stripe_last_check)
+            transactions[0].state = "pending"
+            last_check = datetime.now() - timedelta(hours=1)
+            transactions[3].invader_stripe_last_check = last_check
+            retrieve.reset_mock()
+            self.env[
+                "payment.transaction"
+            ]._cron_reconcile_stripe_transactions()
+        self.assertEqual(2, retrieve.call_count)
+        self.assertEqual(
+            ["done", "done", "cancel", "pending"],
+            transactions.mapped("state"),
+        )
+
+    def test_payment_stripe_reconcile_abandon(self):
+        self.acquirer.stripe_secret_key = "sk_test_reconcile"
+        transactions = self.env["payment.transaction"].browse()
+        statuses = {
+            "pi_abandoned": "requires_payment_method",
+            "pi_processing": "processing",
+            "pi_cancel_failed": "requires_action",
+        }
+        for intent_id in statuses:
+            transaction = self.env["payment.transaction"].create(
+                self.cart._invader_prepare_payment_transaction_data(
+                    self.acquirer
+                )
+            )
+            transaction.write(
+                {"acquirer_reference": intent_id, "state": "pending"}
+            )
+            transactions |= transaction
+        self.env["base"].flush()
+        self.env.cr.execute(
+            "UPDATE payment_transaction SET create_date = %s WHERE id IN %s",
+            (datetime.now() - timedelta(days=2), tuple(transactions.ids)),
+        )
+        transactions.invalidate_cache()
+
+        def retrieve_payment_intent(client, intent_id):
+            return PaymentIntent.construct_from(
+                {"id": intent_id, "status": statuses[intent_id]},
+                client.api_key,
+            )
+
+        def cancel_payment_intent(client, intent_id):
+            if intent_id == "pi_cancel_failed":
+                raise Exception("Stripe unavailable")
+            return PaymentIntent.construct_from(
+                {"id": intent_id, "status": "canceled"}, client.api_key
+            )
+
+        with mock.patch.object(
+            StripeClient,
+            "retrieve_payment_intent",
+            autospec=True,
+            side_effect=retrieve_payment_intent,
+        ), mock.patch.object(
+            StripeClient,
+            "cancel_payment_intent",
+            autospec=True,
+            side_effect=cancel_payment_intent,
+        ) as cancel:
+            self.env[
+                "payment.transaction"
+            ]._cron_reconcile_stripe_transactions()
+        # the processing intent is never abandoned
+        self.assertEqual(
+            ["pi_abandoned", "pi_cancel_failed"],
+            sorted(call[0][1] for call in cancel.call_args_list),
+        )
+        self.assertEqual(
+            ["cancel", "pending", "pending"], transactions.mapped("state")
+        )
+
+    def test_payment_stripe_stand_in(self):
+        with StripeStandIn(requires_action_rate=1) as server:
+            self.acquirer.write(
+                {
+                    "stripe_secret_key": "sk_test_stand_in",
+                    "stripe_api_base": server.api_base,
+                }
+            )
+            params = {
+                "target": "current_cart",
+                "payment_mode_id": self.acquirer.id,
+            }
+            res = self.payment_service.dispatch(
+                "confirm_payment",
+                params=dict(params, stripe_payment_method_id="pm_card_visa"),
+            )
+            self.assertTrue(res["requires_action"])
+            self.assertEqual("pending", self.cart.transaction_ids.state)
+            intent_id = res["payment_intent_client_secret"].split("_secret")[0]
+            res = self.payment_service.dispatch(
+                "confirm_payment",
+                params=dict(params, stripe_payment_intent_id=intent_id),
+            )
+        self.assertEqual({"success": True}, res)
+        self.assertEqual("done", self.cart.transaction_ids.state)
+
+    def test_payment_stripe_prepare_intent(self):
+        params = {
+            "target": "current_cart",
+            "payment_mode_id": self.acquirer.id,
+        }
+        with StripeStandIn() as server:
+            self.acquirer.write(
+                {
+                    "stripe_secret_key": "sk_test_prepare_intent",
+                    "stripe_api_base": server.api_base,
+                }
+            )
+            res = self.payment_service.dispatch(
+                "prepare_intent", params=params
+            )
+            transaction = self.cart.transaction_ids
+            self.assertEqual(
+                transaction.acquirer_reference, res["payment_intent_id"]
+            )
+            self.assertTrue(transaction.invader_stripe_client_confirm)
+            self.assertEqual("draft", transaction.state)
+            # the payment step is shown again: same transaction and intent
+            self.assertEqual(
+                res,
+                self.payment_service.dispatch("prepare_intent", params=params),
+            )
+            self.assertEqual(transaction, self.cart.transaction_ids)
+            self.assertEqual(1, len(server.intents))
+            intent = server.get_intent(res["payment_intent_id"])
+            self.assertEqual(
+                intent["client_secret"], res["payment_intent_client_secret"]
+            )
+            self.assertEqual("requires_payment_method", intent["status"])
+            # the client confirms the intent with Stripe
+            server.update_intent(intent["id"], "succeeded")
+            res = self.payment_service.dispatch(
+                "confirm_payment",
+                params=dict(params, stripe_payment_intent_id=intent["id"]),
+            )
+        self.assertEqual({"success": True}, res)
+        self.assertEqual("done", transaction.state)
+
+    def test_payment_stripe_prepare_intent_amount_changed(self):
+        params = {
+            "target": "current_cart",
+            "payment_mode_id": self.acquirer.id,
+        }
+        with StripeStandIn() as server:
+            self.acquirer.write(
+                {
+                    "stripe_secret_key": "sk_test_prepare_intent",
+                    "stripe_api_base": server.api_base,
+                }
+            )
+            res = self.payment_service.dispatch(
+                "prepare_intent", params=params
+            )
+            transaction = self.cart.transaction_ids
+            self.cart.order_line[0].product_uom_qty += 1
+            # the intent of the old amount is confirmed by the client
+            server.update_intent(res["payment_intent_id"], "succeeded")
+            res = self.payment_service.dispatch(
+                "confirm_payment",
+                params=dict(
+                    params, stripe_payment_intent_id=res["payment_intent_id"]
+                ),
+            )
+        # the card is charged: the payment is kept, to review
+        self.assertEqual(
+            self.payment_service._generate_stripe_mismatch_response(), res
+        )
+        self.assertEqual("done", transaction.state)
+        self.assertTrue(transaction.invader_stripe_to_review)
+
+    def test_payment_stripe_prepare_intent_amount_changed_unpaid(self):
+        params = {
+            "target": "current_cart",
+            "payment_mode_id": self.acquirer.id,
+        }
+        with StripeStandIn() as server:
+            self.acquirer.write(
+                {
+                    "stripe_secret_key": "sk_test_prepare_intent",
+                    "stripe_api_base": server.api_base,
+                }
+            )
+            res = self.payment_service.dispatch(
+                "prepare_intent", params=params
+            )
+            transaction = self.cart.transaction_ids
+            self.cart.order_line[0].product_uom_qty += 1
+            # the payment step is shown again, for the new amount
+            new_res = self.payment_service.dispatch(
+                "prepare_intent", params=params
+            )
+        # the client can no longer pay the first intent
+        self.assertEqual(
+            "canceled", server.get_intent(res["payment_intent_id"])["status"]
+        )
+        self.assertEqual("cancel", transaction.state)
+        new_transaction = self.cart.transaction_ids - transaction
+        self.assertEqual(self.cart.amount_total, new_transaction.amount)
+        self.assertEqual(
+            new_res["payment_intent_id"], new_transaction.acquirer_reference
+        )
+        self.assertEqual(2, len(server.intents))
+
+    def _dispatch_confirm_payment_timeout(self, params):
+        """
+        Dispatch confirm_payment, Stripe creating the intent but the
+        request timing out (the worker is killed) before its response is
+        applied. Return the draft transaction left.
+        """
+        create_payment_intent = StripeClient.create_payment_intent
+
+        class RequestTimeout(BaseException):
+            pass
+
+        def create_payment_intent_timeout(client, **params):
+            create_payment_intent(client, **params)
+            raise RequestTimeout()
+
+        # the draft transaction is committed on a cursor of its own
+        self.acquirer.stripe_two_phase_confirm = True
+        self.registry.enter_test_mode(self.cr)
+        self.addCleanup(self.registry.leave_test_mode)
+        with mock.patch.object(
+            StripeClient,
+            "create_payment_intent",
+            autospec=True,
+            side_effect=create_payment_intent_timeout,
+        ), self.assertRaises(RequestTimeout):
+            self.payment_service.dispatch("confirm_payment", params=params)
+        self.cart.invalidate_cache()
+        transaction = self.cart.transaction_ids
+        self.assertEqual("draft", transaction.state)
+        return transaction
+
+    def test_payment_stripe_idempotent_intent(self):
+        params = {
+            "target": "current_cart",
+            "payment_mode_id": self.acquirer.id,
+            "stripe_payment_method_id": "pm_card_visa",
+        }
+        with StripeStandIn() as server:
+            self.acquirer.write(
+                {
+                    "stripe_secret_key": "sk_test_idempotent_intent",
+                    "stripe_api_base": server.api_base,
+                }
+            )
+            transaction = self._dispatch_confirm_payment_timeout(params)
+            self.assertEqual(1, len(server.intents))
+            # the client retries the payment
+            res = self.payment_service.dispatch(
+                "confirm_payment", params=params
+            )
+        self.assertEqual({"success": True}, res)
+        self.cart.invalidate_cache()
+        self.assertEqual(transaction, self.cart.transaction_ids)
+        self.assertEqual("done", transaction.state)
+        self.assertEqual(
+            [transaction.acquirer_reference], list(server.intents)
+        )
+
+    def test_payment_stripe_idempotent_intent_amount_changed(self):
+        params = {
+            "target": "current_cart",
+            "payment_mode_id": self.acquirer.id,
+            "stripe_payment_method_id": "pm_card_visa",
+        }
+        with StripeStandIn() as server:
+            self.acquirer.write(
+                {
+                    "stripe_secret_key": "sk_test_idempotent_intent",
+                    "stripe_api_base": server.api_base,
+                }
+            )
+            transaction = self._dispatch_confirm_payment_timeout(params)
+            # the cart is changed before the payment is retried
+            self.cart.order_line[0].product_uom_qty += 1
+            self.env["base"].flush()
+            res = self.payment_service.dispatch(
+                "confirm_payment", params=params
+            )
+        # the card is already charged: no second charge
+        self.assertEqual(
+            self.payment_service._generate_stripe_mismatch_response(), res
+        )
+        self.cart.invalidate_cache()
+        self.assertEqual(transaction, self.cart.transaction_ids)
+        self.assertEqual("done", transaction.state)
+        self.assertTrue(transaction.invader_stripe_to_review)
+        self.assertEqual(
+            [transaction.acquirer_reference], list(server.intents)
+        )
+
+    def test_payment_stripe_idempotent_intent_amount_changed_unpaid(self):
+        params = {
+            "target": "current_cart",
+            "payment_mode_id": self.acquirer.id,
+            "stripe_payment_method_id": "pm_card_visa",
+        }
+        with StripeStandIn(requires_action_rate=1) as server:
+            self.acquirer.write(
+                {
+                    "stripe_secret_key": "sk_test_idempotent_intent",
+                    "stripe_api_base": server.api_base,
+                }
+            )
+            transaction = self._dispatch_confirm_payment_timeout(params)
+            (intent_id,) = list(server.intents)
+            # the cart is changed before the payment is retried
+            self.cart.order_line[0].product_uom_qty += 1
+            self.env["base"].flush()
+            res = self.payment_service.dispatch(
+                "confirm_payment", params=params
+            )
+        self.assertTrue(res["requires_action"])
+        self.cart.invalidate_cache()
+        new_transaction = self.cart.transaction_ids - transaction
+        # the first intent can no longer be paid
+        self.assertEqual("canceled", server.get_intent(intent_id)["status"])
+        self.assertEqual("cancel", transaction.state)
+        self.assertEqual("pending", new_transaction.state)
+        self.assertEqual(self.cart.amount_total, new_transaction.amount)
+        intent = server.get_intent(new_transaction.acquirer_reference)
+        self.assertEqual(
+            int(round(self.cart.amount_total * 100)), intent["amount"]
+        )
+        self.assertEqual(2, len(server.intents))
+
+    def test_payment_stripe_manual_capture(self):
+        with StripeStandIn() as server:
+            self.acquirer.write(
+                {
+                    "stripe_secret_key": "sk_test_manual_capture",
+                    "stripe_api_base": server.api_base,
+                    "stripe_capture_method": "manual",
+                }
+            )
+            res = self.payment_service.dispatch(
+                "confirm_payment",
+                params={
+                    "target": "current_cart",
+                    "payment_mode_id": self.acquirer.id,
+                    "stripe_payment_method_id": "pm_card_visa",
+                },
+            )
+            self.assertEqual({"success": True}, res)
+            transaction = self.cart.transaction_ids
+            self.assertEqual("authorized", transaction.state)
+            self.assertEqual("sale", self.cart.typology)
+            intent = server.get_intent(transaction.acquirer_reference)
+            self.assertEqual("manual", intent["capture_method"])
+            # not captured until requested
+            transaction_obj = self.env["payment.transaction"]
+            transaction_obj._cron_capture_stripe_transactions()
+            self.assertEqual("authorized", transaction.state)
+            # the Capture Transaction button requests the capture
+            transaction.action_capture()
+            self.assertTrue(transaction.invader_stripe_capture_requested)
+            transaction_obj._cron_capture_stripe_transactions()
+        self.assertEqual("done", transaction.state)
+        self.assertFalse(transaction.invader_stripe_capture_requested)
+        self.assertEqual("succeeded", intent["status"])
+
+    def test_payment_stripe_circuit_breaker(self):
+        breaker_name = (self.env.cr.dbname, self.acquirer.id)
+        self.addCleanup(circuit_breaker._breakers.pop, breaker_name, None)
+        metrics.registry.reset()
+        params = {
+            "target": "current_cart",
+            "payment_mode_id": self.acquirer.id,
+            "stripe_payment_method_id": "pm_card_visa",
+        }
+        with StripeStandIn(error_rate=1) as server:
+            self.acquirer.write(
+                {
+                    "stripe_secret_key": "sk_test_breaker",
+                    "stripe_api_base": server.api_base,
+                    "stripe_breaker_threshold": 2,
+                }
+            )
+            for __ in range(3):
+                res = self.payment_service.dispatch(
+                    "confirm_payment",
+                    params=dict(params, idempotency_key="breaker"),
+                )
+                self.assertIn("error", res)
+        # the outcome of the failed calls is unknown: the draft transaction
+        # is kept for the retries, and the third call failed fast
+        self.assertEqual(1, len(self.cart.transaction_ids))
+        self.assertEqual("draft", self.cart.transaction_ids.state)
+        # neither the failures nor the fast failures are replayed
+        self.assertFalse(
+            self.env["invader.payment.idempotency.key"].search(
+                [("key", "=", "breaker")]
+            )
+        )
+        self.assertEqual(
+            1, metrics.registry.get_counter("payment_stripe.circuit_open")
+        )
+        self.assertEqual(
+            1,
+            metrics.registry.get_counter(
+                "payment_stripe.circuit_breaker.open"
+            ),
+        )
@@ -13,3 +13,12 @@ class PaymentTransaction(models.Model):
         if self.partner_id:
             return self.partner_id
         return super(PaymentTransaction, self)._get_invader_payables()
+
+    def _get_invader_payables_map(self):
+        # partner_id is read once for the whole recordset
+        with_partner = self.filtered("partner_id")
+        res = super(
+            PaymentTransaction, self - with_partner
+        )._get_invader_payables_map()
+        res.update({record: record.partner_id for record in with_partner})
+        return res
@@ -1,3 +1,2 @@
 from . import test_invader_payment_manual
-from . import test_invader_payment_sips
 from . import test_invader_payment_stripe